@@ -1,12 +1,16 @@
 import os
-import secrets
+import hmac
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse, PlainTextResponse
 from dotenv import load_dotenv, find_dotenv
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.middleware.sessions import SessionMiddleware
 
 from .manager import load_all_routers, console
+from .plugins.utils.session import add_session_middleware
+from .plugins.utils.database import QueryStatsMiddleware
+from .plugins.utils.metrics import MetricsMiddleware, render_metrics
+from .plugins.utils.profiling import LoopLagMiddleware, ProfilingMiddleware
 
 
 def create_app():
@@ -28,23 +32,57 @@ def create_app():
         allow_origins=["*"],
         allow_credentials=True,
         allow_methods=["*"],
-        allow_headers=["*"]
-    )
-    app.add_middleware(
-        SessionMiddleware,
-        secret_key=secrets.token_hex(16)
+        allow_headers=["*"],
+        expose_headers=["X-Profile-Id"]
     )
+    # 需要读取 session，必须在 session 中间件之前注册（位于其内侧）
+    app.add_middleware(ProfilingMiddleware)
+    # 记录每个任务正在处理的路由，用于把事件循环阻塞归因到路由，需要在路由匹配之后读取 scope
+    app.add_middleware(LoopLagMiddleware)
+    add_session_middleware(app)
+    app.add_middleware(QueryStatsMiddleware)
+    app.add_middleware(MetricsMiddleware)
     # 注册 router
-    load_all_routers(
+    manager = load_all_routers(
         app,
         plugin_dirs = [
             os.path.dirname(__file__) + "/plugins"
         ]
     )
 
+    @app.get("/ready", tags=["ready"])
+    async def ready() -> JSONResponse:
+        """
+        返回各插件的初始化状态，全部完成时为 200，否则为 503
+        """
+        is_ready, plugins = manager.readiness()
+        return JSONResponse(content={
+            "ready": is_ready,
+            "plugins": plugins
+        }, status_code=status.HTTP_200_OK if is_ready else status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    @app.get("/metrics", tags=["metrics"], response_class=PlainTextResponse)
+    async def metrics(request: Request) -> PlainTextResponse:
+        """
+        以 Prometheus 文本格式返回当前 worker 进程的请求、邮件与文件读写指标
+
+        需要管理员 session，或者在请求头中带上 Authorization: Bearer <METRICS_TOKEN>；
+        设置环境变量 METRICS_PUBLIC=1 后允许任何人访问
+        """
+        token = os.getenv("METRICS_TOKEN")
+        authorization = request.headers.get("authorization", "")
+        if (
+            os.getenv("METRICS_PUBLIC") != "1"
+            and not (token and hmac.compare_digest(authorization.encode(), f"Bearer {token}".encode()))
+            and request.session.get("identity") != "Administrator"
+        ):
+            return PlainTextResponse("权限不足！", status_code=status.HTTP_403_FORBIDDEN)
+        return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
     return app
 
 
-app = create_app()
+# session 等配置在创建 app 时读取，需要先加载 .env
 if load_dotenv(find_dotenv(), verbose=True):
     console.log("[green]成功加载[/green] [yellow].env[/yellow] [blue]文件！[/blue]")
+app = create_app()
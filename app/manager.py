@@ -1,10 +1,17 @@
 import os
+import sys
+import time
+import asyncio
 import pkgutil
+import builtins
 import importlib
 
 from rich.console import Console
+from rich.table import Table
 from fastapi import FastAPI
-from typing import Optional, Iterable, Set, Dict
+from starlette.types import Lifespan
+from contextlib import asynccontextmanager, contextmanager
+from typing import Optional, Iterable, Set, Dict, Any, Tuple, AsyncGenerator, Generator
 from pathlib import Path
 
 
@@ -15,15 +22,20 @@ def load_all_routers(
     app: FastAPI,
     plugins: Optional[Iterable[str]] = None,
     plugin_dirs: Optional[Iterable[str]] = None
-) -> None:
+) -> "PluginManager":
     """为 FastAPI 加载所有的路由
 
     Args:
         app (FastAPI): FastAPI 实例
         plugins (Optional[Iterable[str]]): 独立插件路径列表
         plugin_dirs (Optional[Iterable[str]]): 插件文件夹列表
+
+    Returns:
+        PluginManager: 插件管理器，可以通过它查询各插件的启动状态
     """
-    PluginManager(app, plugins, plugin_dirs).load_all_plugins()
+    manager = PluginManager(app, plugins, plugin_dirs)
+    manager.load_all_plugins()
+    return manager
 
 
 def path_to_module_name(path: Path):
@@ -39,6 +51,44 @@ def _module_name_to_plugin_name(module_name: str) -> str:
     return module_name.split(".", 1)[-1]
 
 
+@asynccontextmanager
+async def _empty_lifespan(_: Any) -> AsyncGenerator[None, None]:
+    yield
+
+
+@contextmanager
+def _empty_context() -> Generator[None, None, None]:
+    yield
+
+
+@contextmanager
+def _profile_imports(records: Dict[str, float]) -> Generator[None, None, None]:
+    """
+    统计期间首次导入的外部模块各自的用时（秒），只记录最外层的导入，结果累加到 records 中
+    """
+    original_import = builtins.__import__
+    depth = 0
+
+    def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+        nonlocal depth
+        if level != 0 or depth > 0 or name in sys.modules or name.split(".")[0] == __package__:
+            return original_import(name, globals, locals, fromlist, level)
+        depth += 1
+        begin = time.perf_counter()
+        try:
+            return original_import(name, globals, locals, fromlist, level)
+        finally:
+            depth -= 1
+            top = name.split(".")[0]
+            records[top] = records.get(top, 0.0) + time.perf_counter() - begin
+
+    builtins.__import__ = timed_import
+    try:
+        yield
+    finally:
+        builtins.__import__ = original_import
+
+
 class PluginManager:
     """
     为 FastAPI 应用编写的插件管理器
@@ -61,6 +111,16 @@ class PluginManager:
 
         self._third_party_plugin_names: Dict[str, str] = {}
         self._searched_plugin_names: Dict[str, Path] = {}
+        # 插件名: 插件路由的 lifespan，由 PluginManager 统一并发执行
+        self._lifespans: Dict[str, Lifespan[Any]] = {}
+        # 插件名: 启动状态，包含 state(pending/starting/ready/failed/stopped)、elapsed(秒)、error
+        self.startup_states: Dict[str, Dict[str, Any]] = {}
+        # 设置环境变量 STARTUP_PROFILE=1 后输出各插件的导入、注册与初始化用时
+        self.profile: bool = os.getenv("STARTUP_PROFILE") == "1"
+        # 插件名: 加载用时，包含 import(秒)、include(秒)、modules(新导入的模块数)
+        self.load_times: Dict[str, Dict[str, Any]] = {}
+        # 外部模块名: (导入用时(秒), 触发导入的插件名)
+        self.import_times: Dict[str, Tuple[float, str]] = {}
         self.prepare_plugins()
 
     def __repr__(self) -> str:
@@ -131,24 +191,41 @@ class PluginManager:
             name: name of the plugin
         """
         try:
-            if name in self.plugins:
-                module = importlib.import_module(name)
-            elif name in self._third_party_plugin_names:
-                module = importlib.import_module(self._third_party_plugin_names[name])
-            elif name in self._searched_plugin_names:
-                module = importlib.import_module(
-                    "." + path_to_module_name(self._searched_plugin_names[name]),
-                    package=__package__
-                )
-            else:
-                raise RuntimeError(f"插件未找到: {name}! 请检查你的插件名称！")
+            module_count = len(sys.modules)
+            import_records: Dict[str, float] = {}
+            begin = time.perf_counter()
+            with _profile_imports(import_records) if self.profile else _empty_context():
+                if name in self.plugins:
+                    module = importlib.import_module(name)
+                elif name in self._third_party_plugin_names:
+                    module = importlib.import_module(self._third_party_plugin_names[name])
+                elif name in self._searched_plugin_names:
+                    module = importlib.import_module(
+                        "." + path_to_module_name(self._searched_plugin_names[name]),
+                        package=__package__
+                    )
+                else:
+                    raise RuntimeError(f"插件未找到: {name}! 请检查你的插件名称！")
+            import_time = time.perf_counter() - begin
+            for module_name, elapsed in import_records.items():
+                self.import_times[module_name] = (elapsed, name)
 
             if (router := getattr(module, "__router__", None)) is None:
                 raise RuntimeError(
                     f"模块 {module.__name__} 未正确作为插件加载! "
                     "请确认 `__blueprint__` 变量的值是否正确."
                 )
+            # 取出插件的 lifespan，避免 include_router 将其嵌套成串行执行
+            self._lifespans[name] = router.lifespan_context
+            self.startup_states[name] = {"state": "pending", "elapsed": None, "error": None}
+            router.lifespan_context = _empty_lifespan
+            begin = time.perf_counter()
             self.app.include_router(router=router)
+            self.load_times[name] = {
+                "import": import_time,
+                "include": time.perf_counter() - begin,
+                "modules": len(sys.modules) - module_count
+            }
             console.log(
                 f'[green]成功加载[/green] 插件 "[yellow]{name}[/yellow]"'
             )
@@ -162,3 +239,138 @@ class PluginManager:
     def load_all_plugins(self):
         for name in self.available_plugins:
             self.load_plugin(name)
+
+        original_lifespan = self.app.router.lifespan_context
+
+        @asynccontextmanager
+        async def lifespan(app: FastAPI) -> AsyncGenerator[Any, None]:
+            async with original_lifespan(app) as state:
+                async with self.run_lifespans(app):
+                    yield state
+
+        self.app.router.lifespan_context = lifespan
+        if self.profile:
+            self.print_load_profile()
+
+    def print_load_profile(self) -> None:
+        """
+        输出各插件导入与注册路由的用时，以及导入的外部模块用时
+        """
+        table = Table(title="插件加载用时")
+        table.add_column("插件", style="yellow")
+        table.add_column("导入 (ms)", justify="right")
+        table.add_column("注册路由 (ms)", justify="right")
+        table.add_column("新导入模块数", justify="right")
+        for name, times in sorted(self.load_times.items(), key=lambda x: -x[1]["import"]):
+            table.add_row(
+                name,
+                f"{times['import'] * 1000:.1f}",
+                f"{times['include'] * 1000:.1f}",
+                str(times["modules"])
+            )
+        console.print(table)
+
+        table = Table(title="外部模块导入用时")
+        table.add_column("模块", style="yellow")
+        table.add_column("用时 (ms)", justify="right")
+        table.add_column("导入者", style="magenta")
+        for module_name, (elapsed, plugin) in sorted(self.import_times.items(), key=lambda x: -x[1][0]):
+            table.add_row(module_name, f"{elapsed * 1000:.1f}", plugin)
+        console.print(table)
+
+    def print_startup_profile(self) -> None:
+        """
+        输出各插件初始化（lifespan）的用时
+        """
+        table = Table(title="插件初始化用时")
+        table.add_column("插件", style="yellow")
+        table.add_column("状态")
+        table.add_column("用时 (ms)", justify="right")
+        for name, state in sorted(self.startup_states.items(), key=lambda x: -(x[1]["elapsed"] or 0.0)):
+            elapsed = state["elapsed"]
+            table.add_row(name, state["state"], "-" if elapsed is None else f"{elapsed * 1000:.1f}")
+        console.print(table)
+
+    @property
+    def is_ready(self) -> bool:
+        return all(state["state"] == "ready" for state in self.startup_states.values())
+
+    def readiness(self) -> Tuple[bool, Dict[str, Dict[str, Any]]]:
+        """
+        返回是否所有插件都已完成初始化，以及各插件的启动状态
+        """
+        return self.is_ready, {name: dict(state) for name, state in self.startup_states.items()}
+
+    async def run_plugin_lifespan(
+        self,
+        name: str,
+        app: FastAPI,
+        started: asyncio.Event,
+        shutdown: asyncio.Event
+    ) -> None:
+        """
+        在独立的 task 中执行一个插件的 lifespan，完成初始化后等待 shutdown 信号
+
+        Params:
+            name: 插件名
+            app: FastAPI 实例
+            started: 初始化结束（无论成功与否）时设置
+            shutdown: 应用关闭时设置
+        """
+        state = self.startup_states[name]
+        state["state"] = "starting"
+        begin = time.perf_counter()
+        try:
+            async with self._lifespans[name](app):
+                state["state"] = "ready"
+                state["elapsed"] = time.perf_counter() - begin
+                console.log(
+                    f'[green]初始化完成[/green] 插件 "[yellow]{name}[/yellow]" '
+                    f'用时 [blue]{state["elapsed"] * 1000:.1f}ms[/blue]'
+                )
+                started.set()
+                await shutdown.wait()
+            state["state"] = "stopped"
+        except Exception as e:
+            if state["state"] != "ready":
+                state["elapsed"] = time.perf_counter() - begin
+            state["state"] = "failed"
+            state["error"] = repr(e)
+            console.log(
+                f'[red][on #F8BBD0]插件 "{name}" 初始化失败！[/on #F8BBD0][/red]'
+            )
+            console.print_exception(show_locals=True)
+        finally:
+            started.set()
+
+    @asynccontextmanager
+    async def run_lifespans(self, app: FastAPI) -> AsyncGenerator[None, None]:
+        """
+        并发执行所有插件的 lifespan
+
+        默认等待所有插件初始化完成后才开始接受请求，任意插件失败则中止启动；
+        设置环境变量 STARTUP_IN_BACKGROUND=1 后立即开始接受请求，由 /ready 报告初始化进度
+        """
+        shutdown = asyncio.Event()
+        started: Dict[str, asyncio.Event] = {name: asyncio.Event() for name in self._lifespans}
+        tasks = [
+            asyncio.create_task(self.run_plugin_lifespan(name, app, event, shutdown))
+            for name, event in started.items()
+        ]
+
+        async def wait_started() -> None:
+            await asyncio.gather(*[event.wait() for event in started.values()])
+            if self.profile:
+                self.print_startup_profile()
+
+        try:
+            if os.getenv("STARTUP_IN_BACKGROUND") != "1":
+                await wait_started()
+                if failed := [name for name, state in self.startup_states.items() if state["state"] == "failed"]:
+                    raise RuntimeError(f"插件初始化失败: {', '.join(failed)}")
+            else:
+                tasks.append(asyncio.create_task(wait_started()))
+            yield
+        finally:
+            shutdown.set()
+            await asyncio.gather(*tasks)
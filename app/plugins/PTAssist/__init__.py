@@ -1,4 +1,5 @@
 import os
+import asyncio
 
 from fastapi import APIRouter
 from contextlib import asynccontextmanager
@@ -19,7 +20,8 @@ async def init_db(_: APIRouter) -> AsyncGenerator[None, None]:
             await crud.bind_lottery(db, schemas.Lottery(team_name="None", lottery_id=-1))
     if os.path.exists(Config.CONFIG_PATH):
         try:
-            crud.server_config = crud.ServerConfigReader(Config.CONFIG_PATH)
+            # 解析 xls 是阻塞操作，放到线程中执行，不阻塞其他插件的并发初始化
+            crud.server_config = await asyncio.to_thread(crud.ServerConfigReader, Config.CONFIG_PATH)
             async with database.Session() as session:
                 await crud.create_all_rooms(session, crud.server_config.room_total)
         except Exception:
@@ -1,8 +1,8 @@
 import os
+import orjson
 import aiofiles
 
 from datetime import datetime
-from json import loads, dumps
 from pydantic import BaseModel
 from typing import Dict, Any, List
 from fastapi import Request, Depends, Response, status, File
@@ -15,6 +15,18 @@ from .database import get_db, crud, schemas
 from ...manager import console
 
 
+def serve_file(path: str, filename: str, kind: str) -> FileResponse:
+    """
+    返回文件下载响应，并将文件大小计入读取的字节数
+    """
+    crud.file_bytes_total.inc("read", kind, amount=os.path.getsize(path))
+    return FileResponse(
+        path=path,
+        filename=filename,
+        status_code=status.HTTP_200_OK
+    )
+
+
 @router.get("/total/room")
 async def get_total_room() -> JSONResponse:
     """
@@ -55,9 +67,11 @@ class GetRoomdataItem(BaseModel):
 
 
 @router.post("/roomdata")
-async def get_roomdata(item: GetRoomdataItem, db: AsyncSession = Depends(get_db)) -> JSONResponse:
+async def get_roomdata(item: GetRoomdataItem, db: AsyncSession = Depends(get_db)) -> Response:
     """
     获取指定会场的数据
+
+    会场数据会被缓存，平板轮询时只需要按主键查询一次会场令牌，不需要读取文件
     """
     if crud.server_config is None:
         return JSONResponse(content={
@@ -77,23 +91,25 @@ async def get_roomdata(item: GetRoomdataItem, db: AsyncSession = Depends(get_db)
         Config.ROUND_FOLDER_NAME.format(id=item.round_id),
         Config.ROOM_FILE_NAME.format(id=item.room_id)
     )
-    if not os.path.exists(file_path):
-        return JSONResponse(content={
-            "msg": "会场数据文件不存在！"
-        }, status_code=status.HTTP_404_NOT_FOUND)
     try:
-        async with aiofiles.open(file_path, "r", encoding="utf-8") as file:
-            file_json = loads("".join(await file.readlines()))
+        body = await crud.roomdata_cache.get(file_path)
     except Exception:
         console.print_exception(show_locals=True)
         return JSONResponse(content={
             "msg": "会场数据文件解析失败！"
         }, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
-    return JSONResponse(content={
-        "data": file_json,
-        "rule": crud.server_config.match_rule,
-        "match_type": crud.server_config.match_type
-    }, status_code=status.HTTP_200_OK)
+    if body is None:
+        return JSONResponse(content={
+            "msg": "会场数据文件不存在！"
+        }, status_code=status.HTTP_404_NOT_FOUND)
+    # 会场数据是缓存的文件原始内容，只需要序列化比赛规则并拼接
+    return Response(
+        b'{"data":' + body
+        + b',"rule":' + orjson.dumps(crud.server_config.match_rule)
+        + b',"match_type":' + orjson.dumps(crud.server_config.match_type) + b'}',
+        media_type="application/json",
+        status_code=status.HTTP_200_OK
+    )
 
 
 class UploadRoomdataItem(BaseModel):
@@ -132,8 +148,7 @@ async def upload_roomdata(item: UploadRoomdataItem, request: Request, db: AsyncS
         )
         for key in item.new_data["questionMap"].keys():
             item.new_data["questionMap"][key] = item.new_data["questionMap"][key].replace("[!Disabled]", "")
-        async with aiofiles.open(filepath, "w", encoding="utf-8") as file:
-            await file.write(dumps(item.new_data, indent=4, ensure_ascii=False))
+        await crud.write_json(filepath, item.new_data, "scoring")
         return JSONResponse(content={}, status_code=status.HTTP_200_OK)
     except Exception:
         console.print_exception(show_locals=True)
@@ -160,11 +175,7 @@ async def generate_counterpart_table(request: Request, db: AsyncSession = Depend
         return JSONResponse(content={
             "msg": "生成失败！"
         }, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
-    return FileResponse(
-        path=Config.COUNTERPART_TABLE_PATH,
-        filename="counterpart_table.xls",
-        status_code=status.HTTP_200_OK
-    )
+    return serve_file(Config.COUNTERPART_TABLE_PATH, "counterpart_table.xls", "export")
 
 
 @router.get("/manage/counterpart/generate_lottery")
@@ -177,11 +188,7 @@ async def generate_lottery_counterpart_table(request: Request) -> Response:
             "msg": "权限不足！"
         }, status_code=status.HTTP_403_FORBIDDEN)
     await crud.generate_number_counterpart_table()
-    return FileResponse(
-        path=Config.LOTTERY_COUNTERPART_TABLE_PATH,
-        filename="counterpart_table.xls",
-        status_code=status.HTTP_200_OK
-    )
+    return serve_file(Config.LOTTERY_COUNTERPART_TABLE_PATH, "counterpart_table.xls", "export")
 
 
 @router.get("/manage/rooms/clear")
@@ -231,11 +238,7 @@ async def get_rooms_table(request: Request, db: AsyncSession = Depends(get_db))
         return JSONResponse(content={
             "msg": "导出失败！"
         }, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
-    return FileResponse(
-        path=Config.TOKEN_TABLE_PATH,
-        filename="rooms.xls",
-        status_code=status.HTTP_200_OK
-    )
+    return serve_file(Config.TOKEN_TABLE_PATH, "rooms.xls", "export")
 
 
 @router.post("/manage/config/upload")
@@ -251,6 +254,7 @@ async def upload_config(request: Request, file: bytes = File()) -> JSONResponse:
         os.makedirs(data_folder)
     async with aiofiles.open(Config.CONFIG_PATH, "wb") as config:
         await config.write(file)
+    crud.file_bytes_total.inc("write", "config", amount=len(file))
     if crud.server_config is None:
         crud.server_config = crud.ServerConfigReader(Config.CONFIG_PATH)
     try:
@@ -276,27 +280,25 @@ async def download_config(request: Request) -> Response:
         return JSONResponse(content={
             "msg": "配置文件不存在！"
         }, status_code=status.HTTP_404_NOT_FOUND)
-    return FileResponse(
-        path=Config.CONFIG_PATH,
-        filename="server_config.xls",
-        status_code=status.HTTP_200_OK
-    )
+    return serve_file(Config.CONFIG_PATH, "server_config.xls", "config")
 
 
 @router.get("/manage/rooms/data")
-async def get_data() -> JSONResponse:
+async def get_data() -> Response:
     """
     获取比赛总数据 data.json
+
+    文件在写入时已经检查过是合法的 json，直接以流的形式返回，不需要解析和重新序列化
     """
     filepath = os.path.join(data_folder, "data.json")
     if not os.path.exists(filepath):
         return JSONResponse(content={
             "msg": "数据文件不存在！"
         }, status_code=status.HTTP_404_NOT_FOUND)
-    async with aiofiles.open(filepath, "r", encoding="utf-8") as data_file:
-        data = await data_file.read()
-    return JSONResponse(
-        content=loads(data),
+    crud.file_bytes_total.inc("read", "data", amount=os.path.getsize(filepath))
+    return FileResponse(
+        path=filepath,
+        media_type="application/json",
         status_code=status.HTTP_200_OK
     )
 
@@ -311,8 +313,7 @@ async def upload_data_json(data: Dict[str, Any], request: Request) -> JSONRespon
             "msg": "权限不足！"
         }, status_code=status.HTTP_403_FORBIDDEN)
     filepath = os.path.join(data_folder, "data.json")
-    async with aiofiles.open(filepath, "w", encoding="utf-8") as data_file:
-        await data_file.write(dumps(data, indent=4, ensure_ascii=False))
+    await crud.write_json(filepath, data, "data")
     return JSONResponse(content={}, status_code=status.HTTP_200_OK)
 
 
@@ -418,11 +419,7 @@ async def download_scoring_files(item: ScoringItem, request: Request) -> Respons
         return JSONResponse(content={
             "msg": "文件未找到！"
         }, status_code= status.HTTP_404_NOT_FOUND)
-    return FileResponse(
-        path=filename,
-        filename=filename,
-        status_code=status.HTTP_200_OK
-    )
+    return serve_file(filename, filename, "scoring")
 
 
 @router.get("/manage/lottery/teamnames")
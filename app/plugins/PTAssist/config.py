@@ -51,6 +51,9 @@ class Config:
     #? 接收到的临时文件名，请使用 {round_id} 标识轮次号，{room_id} 标识房间号，{time_stamp} 标识时间戳
     TEMP_FILE_NAME: str = "{room_id}-{round_id}-{time_info}.json"
 
+    #! 会场数据缓存检查文件是否被修改的最短间隔（秒），本进程写入时会立即失效
+    ROOMDATA_CHECK_INTERVAL: float = 2.0
+
     #! 配置表名
     SOFTWARE_CONFIG_SHEET_NAME = "软件配置"
     PROBLEM_SET_SHEET_NAME = "赛题信息"
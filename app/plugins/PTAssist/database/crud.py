@@ -1,21 +1,156 @@
 import os
-import xlrd
-import xlwt
+import time
+import asyncio
+import orjson
 import aiofiles
 
 from math import exp
 from shutil import rmtree
 from functools import reduce
-from json import dumps, loads
 from sqlalchemy import select, delete
 from random import randint, shuffle, random
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import Iterable, Optional, List, Any, Callable, Set, Tuple, Dict
+from typing import Iterable, Optional, List, Any, Callable, Set, Tuple, Dict, TYPE_CHECKING
 
 from . import models, schemas
 from ..config import Config, data_folder
+from ...utils.cache import caches
+from ...utils.metrics import Counter
 from ....manager import console
 
+if TYPE_CHECKING:
+    import xlwt
+
+
+# kind: roomdata（会场数据）/ scoring（待合并的计分文件）/ data（data.json）/ config（配置文件）/ export（导出的表格）
+file_bytes_total: Counter = Counter(
+    "ptassist_file_bytes_total", "PTAssist 读写文件的字节数", ("operation", "kind")
+)
+
+
+async def read_bytes(path: str, kind: str) -> bytes:
+    """
+    读取文件的原始内容，并将读取的字节数计入 file_bytes_total
+    """
+    async with aiofiles.open(path, "rb") as file:
+        content = await file.read()
+    file_bytes_total.inc("read", kind, amount=len(content))
+    return content
+
+
+async def read_json(path: str, kind: str) -> Any:
+    """
+    读取并解析 json 文件，并将读取的字节数计入 file_bytes_total
+    """
+    return orjson.loads(await read_bytes(path, kind))
+
+
+async def write_json(path: str, data: Any, kind: str) -> None:
+    """
+    将 data 写入 json 文件，并将写入的字节数计入 file_bytes_total，写入会场数据时使对应的缓存失效
+
+    序列化时会检查 data 是否为合法的 json（不能序列化时抛出 orjson.JSONEncodeError），
+    所以读取本进程写入的文件时可以直接使用原始内容，不需要解析
+    """
+    content = orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    async with aiofiles.open(path, "wb") as file:
+        await file.write(content)
+    if kind == "roomdata":
+        roomdata_cache.invalidate(path)
+    file_bytes_total.inc("write", kind, amount=len(content))
+
+
+class RoomDataCache:
+    """
+    会场数据文件的读取缓存，保存文件的原始内容，平板轮询时不需要读取文件
+
+    每个文件最多每 check_interval 秒检查一次修改时间与大小，变化时重新读取；
+    本进程写入会场数据时会立即失效。文件可能被手动修改，所以每个版本读取时检查一次是否为合法的 json，
+    之后直接把原始内容拼接到响应中
+
+    Args:
+        check_interval (float): 两次检查文件是否被修改的最短间隔（秒）
+    """
+    def __init__(self, check_interval: float) -> None:
+        self.check_interval = check_interval
+        # 文件路径: {"version": (修改时间, 大小), "checked_at": 上次检查的时间, "body": 文件内容}
+        self.items: Dict[str, Dict[str, Any]] = {}
+        self.hits: int = 0
+        self.misses: int = 0
+        self.invalidations: int = 0
+        # 文件路径: [读取该文件时持有的锁, 正在使用该锁的任务数]，不同会场的读取互不等待，
+        # 没有任务使用时移除，避免随客户端传入的会场编号无限增长
+        self.locks: Dict[str, List[Any]] = {}
+        caches["roomdata"] = self
+
+    def fresh(self, path: str) -> Optional[bytes]:
+        if (item := self.items.get(path)) is None or time.monotonic() - item["checked_at"] >= self.check_interval:
+            return None
+        self.hits += 1
+        return item["body"]
+
+    async def get(self, path: str) -> Optional[bytes]:
+        """
+        返回会场数据文件的内容，文件不存在时返回 None，不是合法的 json 时抛出异常
+        """
+        if (body := self.fresh(path)) is not None:
+            return body
+        if (entry := self.locks.get(path)) is None:
+            entry = self.locks[path] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                return await self.load(path)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self.locks[path]
+
+    async def load(self, path: str) -> Optional[bytes]:
+        if (body := self.fresh(path)) is not None:
+            return body
+        try:
+            stat = await asyncio.to_thread(os.stat, path)
+        except FileNotFoundError:
+            self.items.pop(path, None)
+            self.misses += 1
+            return None
+        version = (stat.st_mtime_ns, stat.st_size)
+        if (item := self.items.get(path)) is not None and item["version"] == version:
+            item["checked_at"] = time.monotonic()
+            self.hits += 1
+            return item["body"]
+        self.misses += 1
+        body = await read_bytes(path, "roomdata")
+        orjson.loads(body)
+        self.items[path] = {"version": version, "checked_at": time.monotonic(), "body": body}
+        return body
+
+    def invalidate(self, path: Optional[str] = None) -> None:
+        """
+        使 path（为空时为全部）的缓存失效
+        """
+        if path is None:
+            self.invalidations += len(self.items)
+            self.items.clear()
+        elif self.items.pop(path, None) is not None:
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self.items),
+            "bytes": sum(len(item["body"]) for item in self.items.values()),
+            "check_interval": self.check_interval,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+
+roomdata_cache: RoomDataCache = RoomDataCache(Config.ROOMDATA_CHECK_INTERVAL)
+
 
 def generate_password(length: int, keyring: str = "1234567890qwertyuiopasdfghjklzxcvbnmQWERTYUIOPASDFGHJKLZXCVBNM") -> str:
     """生成一个随机密码
@@ -153,6 +288,8 @@ class ServerConfigReader:
         self.update(path)
 
     def update(self, path: Optional[str] = None) -> None:
+        import xlrd
+
         if path is None:
             path = self.path
         workbook = xlrd.open_workbook(filename=path)
@@ -233,6 +370,8 @@ class CounterpartTableWriter:
     用来将对局信息写入到 Excel 文件中，已经存在的文件会被覆盖
     """
     def __init__(self, path: str, is_lottery: bool = False) -> None:
+        import xlwt
+
         self.path = path
         with open(self.path, "w", encoding="utf-8"):
             pass
@@ -252,7 +391,7 @@ class CounterpartTableWriter:
 
     def render_table(
         self,
-        sheet: xlwt.Worksheet,
+        sheet: "xlwt.Worksheet",
         offset_row: int,
         offset_col: int,
         table: List[List[Any]],
@@ -511,14 +650,14 @@ def generate_judges(
 
 async def save_json(
     dic: Dict[str, Any],
-    path: str
+    path: str,
+    kind: str
 ) -> bool:
     """
     将字典保存为文件，返回是否成功
     """
     try:
-        async with aiofiles.open(path, "w", encoding="utf-8") as file:
-            await file.write(dumps(dic, indent=4, ensure_ascii=False))
+        await write_json(path, dic, kind)
         return True
     except Exception:
         console.print_exception(show_locals=True)
@@ -535,8 +674,7 @@ async def regenerate_room_data() -> bool:
         return False
 
     try:
-        async with aiofiles.open(os.path.join(data_folder, "data.json"), "r", encoding="utf-8") as file:
-            data_json = loads(await file.read())
+        data_json = await read_json(os.path.join(data_folder, "data.json"), "data")
         folder = os.path.join(Config.MAIN_FOLDER, Config.ROUND_FOLDER_NAME.format(id=1))
         if not os.path.exists(folder):
             return False
@@ -545,8 +683,7 @@ async def regenerate_room_data() -> bool:
             filename = os.path.join(folder, Config.ROOM_FILE_NAME.format(id=room+1))
             if not os.path.exists(filename):
                 return False
-            async with aiofiles.open(filename, "r", encoding="utf-8") as file:
-                room_json = loads(await file.read())
+            room_json = await read_json(filename, "roomdata")
             room_team_data = room_json["teamDataList"]
             room_json["teamDataList"] = []
             for team_data in room_team_data:
@@ -557,6 +694,8 @@ async def regenerate_room_data() -> bool:
     except Exception:
         console.print_exception(show_locals=True)
         return False
+    finally:
+        roomdata_cache.invalidate()
 
     return True
 
@@ -620,13 +759,16 @@ async def generate_room_data(tables: List[List[List[Tuple[str, str]]]]) -> bool:
                         })
                 if r == 0:
                     data_json["teamDataList"] += room_json["teamDataList"]
-                await save_json(room_json, os.path.join(folder, Config.ROOM_FILE_NAME.format(id=room+1)))
+                await save_json(room_json, os.path.join(folder, Config.ROOM_FILE_NAME.format(id=room+1)), "roomdata")
             if r == 0:
-                await save_json(data_json, os.path.join(data_folder, "data.json"))
+                await save_json(data_json, os.path.join(data_folder, "data.json"), "data")
         return True
     except Exception:
         console.print_exception(show_locals=True)
         return False
+    finally:
+        # 轮次文件夹会被整个删除重建，多余的会场文件不会再被写入
+        roomdata_cache.invalidate()
 
 
 def get_all_teamnames() -> List[str]:
@@ -672,6 +814,8 @@ async def generate_counterpart_table(db: AsyncSession) -> bool:
     """
     生成对阵表，返回是否成功
     """
+    import xlrd
+
     if server_config is None:
         return False
 
@@ -728,6 +872,8 @@ async def export_rooms(db: AsyncSession) -> bool:
     """
     导出会场令牌表格，返回是否成功
     """
+    import xlwt
+
     rooms = await get_all_rooms(db)
     workbook = xlwt.Workbook(encoding="utf-8")
 
@@ -753,10 +899,8 @@ async def merge_data(filename: str) -> None:
         return
     if not os.path.exists(filename):
         return
-    async with aiofiles.open(dataname, "r", encoding="utf-8") as f:
-        data_json = loads(await f.read())
-    async with aiofiles.open(filename, "r", encoding="utf-8") as f:
-        new_data = loads(await f.read())
+    data_json = await read_json(dataname, "data")
+    new_data = await read_json(filename, "scoring")
     for item in new_data["teamDataList"]:
         for data_item in data_json["teamDataList"]:
             if item["name"] == data_item["name"]:
@@ -769,5 +913,4 @@ async def merge_data(filename: str) -> None:
                     if not found:
                         data_item["recordDataList"].append(record)
                 break
-    async with aiofiles.open(dataname, "w", encoding="utf-8") as f:
-        await f.write(dumps(data_json, ensure_ascii=False, indent=4))
+    await write_json(dataname, data_json, "data")
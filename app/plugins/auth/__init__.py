@@ -5,13 +5,19 @@ from typing import AsyncGenerator
 from contextlib import asynccontextmanager
 
 from .database import database, crud, schemas
+from ..utils.email import close_mail
+from ..utils.ratelimit import rate_limiter
 
 
 @asynccontextmanager
 async def init_db(_: APIRouter) -> AsyncGenerator[None, None]:
     async with database.engine.begin() as conn:
         await conn.run_sync(database.Base.metadata.create_all)
+        await conn.run_sync(database.add_missing_columns)
     async with database.Session() as db:
+        await crud.migrate_awards(db)
+        await crud.migrate_team_members(db)
+        await crud.create_search_index(db)
         admin = await crud.get_user_by_identity(db, "Administrator")
         if not admin:
             # 创建默认的管理员
@@ -22,6 +28,8 @@ async def init_db(_: APIRouter) -> AsyncGenerator[None, None]:
                 email=None
             ))
     yield
+    await close_mail()
+    await rate_limiter.backend.close()
 
 
 router = APIRouter(
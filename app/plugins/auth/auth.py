@@ -1,19 +1,22 @@
 import time
+import asyncio
 
 from math import ceil
-from base64 import b64decode
+from base64 import b64decode, b64encode
 from pydantic import BaseModel
-from fastapi import File, Request, Depends, Response, status
+from fastapi import File, Form, Request, Depends, Response, UploadFile, status
 from fastapi.responses import FileResponse, JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import Dict, List
+from typing import Any, Dict, List, Optional
 from random import randint
 from functools import reduce
 
 from . import router
 from .config import Config
 from .database import get_db, crud, schemas
-from ..utils.email import send_mail
+from ..utils.email import enqueue_mail, mail_queue, mail_batches, start_mail_batch
+from ..utils.blob import etag_matches
+from ..utils.ratelimit import RateLimit, rate_limiter
 from ...manager import console
 
 
@@ -37,44 +40,110 @@ class VerifyItem(BaseModel):
     email: str
 
 
+verify_limits: List[RateLimit] = [
+    RateLimit("verify_ip", *Config.VERIFY_LIMIT_IP),
+    RateLimit("verify_email", *Config.VERIFY_LIMIT_EMAIL),
+    RateLimit("verify_global", *Config.VERIFY_LIMIT_GLOBAL),
+]
+
+
+def captcha_key(email: str) -> str:
+    return f"captcha:{email.strip().lower()}"
+
+
 @router.post("/verify")
 async def verify_email(item: VerifyItem, request: Request) -> JSONResponse:
     """
     生成验证码并发送到指定邮箱
-    将验证码存储在 session 中
+    验证码保存在服务端，同时按 IP、邮箱和全局三条令牌桶规则限流，只有三条规则都放行时才消耗令牌
+
+    部署在反向代理之后时，需要让 uvicorn 信任代理的 X-Forwarded-For（--forwarded-allow-ips），
+    否则所有用户共用代理的 IP 额度
     """
-    timeout: float = 30.0
-    captcha: str = reduce(lambda x, y: x + y, [str(randint(0, 9)) for _ in range(6)])
-    if (last_time := request.session.get("last_captcha_time")) is not None and (time_left := timeout - (time.time() - last_time)) > 0.0:
+    client_ip = request.client.host if request.client is not None else "unknown"
+    limits = list(zip(verify_limits, [client_ip, item.email.strip().lower(), "*"]))
+    if (time_left := await rate_limiter.hit_all(limits)) > 0.0:
         return JSONResponse(content={
             "time_left": ceil(time_left),
             "msg": f"请在 {ceil(time_left)} 秒后再发送验证码！"
-        }, status_code=status.HTTP_400_BAD_REQUEST)
-    if await send_mail(
+        }, status_code=status.HTTP_400_BAD_REQUEST, headers={"Retry-After": str(ceil(time_left))})
+    captcha: str = reduce(lambda x, y: x + y, [str(randint(0, 9)) for _ in range(6)])
+    # 邮件在后台发送，可以通过 /verify/status/{mail_id} 查询发送结果
+    if (mail_id := enqueue_mail(
         target=item.email, sender_name="NYPT",
         title="NYPT 验证码", msg=Config.VERIFY_MSG % captcha
-    ):
-        request.session["captcha"] = captcha
+    )) is not None:
+        await rate_limiter.backend.set(captcha_key(item.email), {
+            "captcha": captcha,
+            "attempts": 0,
+            "expires": time.time() + Config.CAPTCHA_TTL
+        }, Config.CAPTCHA_TTL)
         request.session["last_captcha_time"] = time.time()
         request.session["email"] = item.email
-        return JSONResponse(content={}, status_code=status.HTTP_200_OK)
+        return JSONResponse(content={
+            "mail_id": mail_id
+        }, status_code=status.HTTP_200_OK)
+    # 邮件没有进入队列，放回令牌，不占用用户的发送额度
+    await rate_limiter.refund(limits)
     return JSONResponse(content={
         "msg": "发送失败！请检查邮箱是否输入正确！"
     }, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class VerifyCheckItem(BaseModel):
+    # 邮箱地址
+    email: str
+    # 验证码
+    captcha: str
+
+
+@router.post("/verify/check")
+async def verify_email_check(item: VerifyCheckItem) -> JSONResponse:
+    """
+    校验验证码，校验成功后验证码立即失效，错误次数过多时验证码也会失效
+    """
+    key = captcha_key(item.email)
+    if (stored := await rate_limiter.backend.get(key)) is None:
+        return JSONResponse(content={
+            "msg": "验证码已过期，请重新发送！"
+        }, status_code=status.HTTP_400_BAD_REQUEST)
+    if stored["captcha"] == item.captcha:
+        await rate_limiter.backend.delete(key)
+        return JSONResponse(content={}, status_code=status.HTTP_200_OK)
+    stored["attempts"] += 1
+    if stored["attempts"] >= Config.CAPTCHA_MAX_ATTEMPTS:
+        await rate_limiter.backend.delete(key)
+    else:
+        # 只更新尝试次数，不延长有效期
+        await rate_limiter.backend.set(key, stored, max(stored["expires"] - time.time(), 0.0))
+    return JSONResponse(content={
+        "msg": "验证码错误！"
+    }, status_code=status.HTTP_400_BAD_REQUEST)
+
+
+@router.get("/verify/status/{mail_id}")
+async def verify_email_status(mail_id: str, request: Request) -> JSONResponse:
+    """
+    查询验证码邮件的发送状态：queued / sending / retrying / sent / failed
+    """
+    if (job := mail_queue.status(mail_id)) is None or job["target"] != request.session.get("email"):
+        return JSONResponse(content={
+            "msg": "未找到该邮件！"
+        }, status_code=status.HTTP_404_NOT_FOUND)
+    return JSONResponse(content={
+        "status": job["status"],
+        "attempts": job["attempts"]
+    }, status_code=status.HTTP_200_OK)
+
+
 @router.get("/deprecate")
 async def deprecate(request: Request) -> JSONResponse:
     """
-    立即销毁 session 中的验证码
+    立即销毁当前 session 对应的验证码
     """
-    try:
-        request.session.pop("captcha")
-        request.session.pop("last_captcha_time")
-        request.session.pop("email")
-    except Exception:
-        console.print_exception(show_locals=True)
-        pass
+    if (email := request.session.pop("email", None)) is not None:
+        await rate_limiter.backend.delete(captcha_key(email))
+    request.session.pop("last_captcha_time", None)
     return JSONResponse(content={}, status_code=status.HTTP_200_OK)
 
 
@@ -106,7 +175,7 @@ async def login(item: LoginItem, request: Request, db: AsyncSession = Depends(ge
     """
     登录，在 session 中保存登录信息
     """
-    try_fetch = await crud.get_user_by_name(db, item.name)
+    try_fetch = await crud.get_user_profile_by_name(db, item.name)
     fetch_token = None
     if try_fetch is not None:
         fetch_token = try_fetch.token
@@ -134,14 +203,14 @@ async def team_info_fetch(request: Request, db: AsyncSession = Depends(get_db))
         return JSONResponse(content={
             "msg": "您并未登录！"
         }, status_code=status.HTTP_400_BAD_REQUEST)
-    fetch_result = await crud.get_user(db, user_id)
+    fetch_result = await crud.get_user_profile(db, user_id)
     if fetch_result is None:
         return JSONResponse({
             "msg": "用户不存在！"
         }, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
     return JSONResponse(content={
-        "leaders": crud.str_decode(str(fetch_result.leaders)),
-        "members": crud.str_decode(str(fetch_result.members)),
+        "leaders": fetch_result.leaders,
+        "members": fetch_result.members,
         "school": "" if fetch_result.school is None else fetch_result.school,
         "contact": "" if fetch_result.contact is None else fetch_result.contact,
         "tel": "" if fetch_result.tel is None else fetch_result.tel
@@ -170,7 +239,7 @@ async def team_info_save(item: TeaminfoSaveItem, request: Request, db: AsyncSess
         return JSONResponse(content={
             "msg": "您尚未登录！"
         }, status_code=status.HTTP_400_BAD_REQUEST)
-    fetch_result = await crud.get_user(db, user_id)
+    fetch_result = await crud.get_user_profile(db, user_id)
     if fetch_result is None:
         return JSONResponse({
             "msg": "用户不存在！"
@@ -178,8 +247,8 @@ async def team_info_save(item: TeaminfoSaveItem, request: Request, db: AsyncSess
     await crud.update_teaminfo(
         db,
         user_id,
-        crud.str_encode(item.leaders),
-        crud.str_encode(item.members),
+        item.leaders,
+        item.members,
         item.school,
         item.contact,
         item.tel
@@ -187,6 +256,35 @@ async def team_info_save(item: TeaminfoSaveItem, request: Request, db: AsyncSess
     return JSONResponse(content={}, status_code=status.HTTP_200_OK)
 
 
+@router.get("/userdata")
+async def fetch_userdata_fields(fields: str, request: Request, db: AsyncSession = Depends(get_db)) -> JSONResponse:
+    """
+    一次获取已登录用户的多个字段，只查询需要的字段
+
+    fields:     逗号分隔的字段列表，可选字段见 crud.USER_DATA_FIELDS，leaders、members 为列表
+                奖项图片请使用 /award
+    """
+    if (user_id := request.session.get("user_id")) is None:
+        return JSONResponse(content={
+            "msg": "您尚未登录！"
+        }, status_code=status.HTTP_400_BAD_REQUEST)
+    field_list = list(dict.fromkeys(field.strip() for field in fields.split(",") if field.strip()))
+    if not field_list:
+        return JSONResponse(content={
+            "msg": "请至少指定一个字段！"
+        }, status_code=status.HTTP_400_BAD_REQUEST)
+    if unknown := [field for field in field_list if field not in crud.USER_DATA_FIELDS]:
+        return JSONResponse(content={
+            "msg": f"未知字段: {', '.join(unknown)}"
+        }, status_code=status.HTTP_400_BAD_REQUEST)
+    data = await crud.get_user_fields(db, user_id, field_list)
+    if data is None:
+        return JSONResponse({
+            "msg": "用户不存在！"
+        }, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return JSONResponse(content=data, status_code=status.HTTP_200_OK)
+
+
 @router.get("/userdata/{which}")
 async def fetch_userdata(which: str, request: Request, db: AsyncSession = Depends(get_db)) -> JSONResponse:
     """
@@ -199,16 +297,16 @@ async def fetch_userdata(which: str, request: Request, db: AsyncSession = Depend
     identity:   itentity
     teamname:   teamname
     contact:    contact
-    leaders:    leaders
-    members:    members
-    award:      award
+    leaders:    leaders（领队列表）
+    members:    members（队员列表）
+    award:      award（base64 data url，直接显示图片请使用 /award）
     all:        除 token 和 award 外全部字段
     """
     if (user_id := request.session.get("user_id")) is None:
         return JSONResponse(content={
             "msg": "您尚未登录！"
         }, status_code=status.HTTP_400_BAD_REQUEST)
-    fetch_result = await crud.get_user(db, user_id)
+    fetch_result = await crud.get_user_profile(db, user_id)
     if fetch_result is None:
         return JSONResponse({
             "msg": "用户不存在！"
@@ -247,8 +345,14 @@ async def fetch_userdata(which: str, request: Request, db: AsyncSession = Depend
                 "members": fetch_result.members
             }, status_code=status.HTTP_200_OK)
         case "award":
+            # 兼容旧接口，返回 data url；直接显示图片请使用 /award
+            if (digest := fetch_result.award_hash) is None or not crud.award_store.exists(str(digest)):
+                return JSONResponse(content={
+                    "award": None
+                }, status_code=status.HTTP_200_OK)
+            content = b64encode(await crud.award_store.read(str(digest))).decode('utf-8')
             return JSONResponse(content={
-                "award": fetch_result.award
+                "award": f"data:{crud.award_store.media_type(str(digest), 'image/png')};base64,{content}"
             }, status_code=status.HTTP_200_OK)
         case "all":
             return JSONResponse(content={
@@ -286,12 +390,15 @@ async def user_create(user: schemas.UserCreate, request: Request, db: AsyncSessi
         return JSONResponse(content={
             "msg": "创建用户失败：用户已经存在！"
         }, status_code=status.HTTP_400_BAD_REQUEST)
+    mail_id = None
     if user.email is not None:
-        await send_mail(
+        mail_id = enqueue_mail(
             target=user.email, sender_name="NYPT",
             title="NYPT 用户信息", msg=Config.CREATE_MSG % (user.name, b64decode(user.token).decode('utf-8'))
         )
-    return JSONResponse(content={}, status_code=status.HTTP_200_OK)
+    return JSONResponse(content={
+        "mail_id": mail_id
+    }, status_code=status.HTTP_200_OK)
 
 
 class UserCreateAllItem(BaseModel):
@@ -303,28 +410,124 @@ class UserCreateAllItem(BaseModel):
     identity: str
     # 密码串长度
     length: int
-
+    # 是否返回包含新建用户名和密码的 xls 表格
+    sheet: bool = False
 
 
 @router.post("/manage/user/createall")
-async def user_createall(item: UserCreateAllItem, request: Request, db: AsyncSession = Depends(get_db)) -> JSONResponse:
+async def user_createall(item: UserCreateAllItem, request: Request, db: AsyncSession = Depends(get_db)) -> Response:
     """
-    批量创建用户，并返回用户总数
+    批量创建用户，已经存在的用户名会被跳过
+
+    默认返回用户总数和新建用户数；sheet 为 true 时返回新建用户的用户名和密码表格
     """
     if request.session.get("identity") != "Administrator":
         return JSONResponse(content={
             "msg": "权限不足！"
         }, status_code=status.HTTP_403_FORBIDDEN)
-    for i in range(item.begin, item.end + 1):
-        await crud.create_user(db, schemas.UserCreate(
-            name="%s%03d" % (item.identity, i),
-            identity=item.identity,
-            token=crud.generate_password(item.length),
-            email=None
-        ))
-    users = await crud.get_all_users(db)
+    created = await crud.create_users(db, [schemas.UserCreate(
+        name="%s%03d" % (item.identity, i),
+        identity=item.identity,
+        token=crud.generate_password(item.length),
+        email=None
+    ) for i in range(item.begin, item.end + 1)])
+    if item.sheet:
+        content = await asyncio.to_thread(crud.generate_credentials_sheet, created)
+        return Response(
+            content=content,
+            media_type="application/vnd.ms-excel",
+            headers={"Content-Disposition": 'attachment; filename="users.xls"'},
+            status_code=status.HTTP_200_OK
+        )
     return JSONResponse(content={
-        "total": len([user for user in users])
+        "total": await crud.count_users(db),
+        "created": len(created)
+    }, status_code=status.HTTP_200_OK)
+
+
+class MailoutRecipient(BaseModel):
+    # 用户名
+    name: str
+    # 收件邮箱，为空时使用用户信息中保存的邮箱
+    email: Optional[str] = None
+
+
+class UserMailoutItem(BaseModel):
+    # 需要发送帐号信息的用户
+    users: List[MailoutRecipient]
+    # 同时发送的邮件数，为空时使用默认值
+    parallelism: Optional[int] = None
+
+
+@router.post("/manage/user/mailout")
+async def user_mailout(item: UserMailoutItem, request: Request, db: AsyncSession = Depends(get_db)) -> JSONResponse:
+    """
+    向一批用户的联系邮箱并发发送帐号信息邮件，立即返回批次 id，发送进度通过 /manage/user/mailout/{batch_id} 查询
+
+    不存在的用户和没有可用邮箱的用户不会发送，在 skipped 中返回
+    """
+    if request.session.get("identity") != "Administrator":
+        return JSONResponse(content={
+            "msg": "权限不足！"
+        }, status_code=status.HTTP_403_FORBIDDEN)
+    credentials = await crud.get_credentials(db, list({user.name for user in item.users}))
+    mails: List[Dict[str, Any]] = []
+    skipped: List[Dict[str, str]] = []
+    for user in item.users:
+        if (credential := credentials.get(user.name)) is None:
+            skipped.append({"name": user.name, "reason": "用户不存在"})
+            continue
+        token, email = credential
+        if (target := user.email or email) is None:
+            skipped.append({"name": user.name, "reason": "没有可用的邮箱"})
+            continue
+        mails.append({
+            "target": target,
+            "title": "NYPT 用户信息",
+            "msg": Config.CREATE_MSG % (user.name, token),
+            "name": user.name
+        })
+    if (batch := start_mail_batch(mails, sender_name="NYPT", parallelism=item.parallelism)) is None:
+        return JSONResponse(content={
+            "msg": "发送失败！服务器未配置邮箱！"
+        }, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return JSONResponse(content={
+        "batch_id": batch.id,
+        "queued": len(mails),
+        "skipped": skipped
+    }, status_code=status.HTTP_200_OK)
+
+
+@router.get("/manage/user/mailout")
+async def user_mailout_list(request: Request) -> JSONResponse:
+    """
+    获取最近的批量发送任务及其进度
+    """
+    if request.session.get("identity") != "Administrator":
+        return JSONResponse(content={
+            "msg": "权限不足！"
+        }, status_code=status.HTTP_403_FORBIDDEN)
+    return JSONResponse(content={
+        "batches": [batch.progress() for batch in reversed(mail_batches.values())]
+    }, status_code=status.HTTP_200_OK)
+
+
+@router.get("/manage/user/mailout/{batch_id}")
+async def user_mailout_progress(batch_id: str, request: Request) -> JSONResponse:
+    """
+    获取批量发送任务的进度与每位收件人的发送结果（status 为 queued / sending / retrying / sent / failed）
+    """
+    if request.session.get("identity") != "Administrator":
+        return JSONResponse(content={
+            "msg": "权限不足！"
+        }, status_code=status.HTTP_403_FORBIDDEN)
+    if (batch := mail_batches.get(batch_id)) is None:
+        return JSONResponse(content={
+            "msg": "未找到该批次！"
+        }, status_code=status.HTTP_404_NOT_FOUND)
+    return JSONResponse(content={
+        **batch.progress(),
+        "results": batch.results()
     }, status_code=status.HTTP_200_OK)
 
 
@@ -366,35 +569,125 @@ async def user_getall(page: int, limit: int, request: Request, db: AsyncSession
         return JSONResponse(content={
             "msg": "权限不足！"
         }, status_code=status.HTTP_403_FORBIDDEN)
-    users = await crud.get_all_users(db, (page - 1) * limit, limit)
+    users = await crud.list_users(db, USER_LIST_DEFAULT_FIELDS, skip=(page - 1) * limit, limit=limit)
     return JSONResponse(content={
-        "users": [{
-            "name": user.name,
-            "user_id": user.user_id,
-            "token": user.token,
-            "email": user.email if user.email is not None else "未提供邮箱",
-            "teamname": user.teamname,
-            "leaders": user.leaders,
-            "members": user.members,
-            "contact": user.contact,
-            "identity": identify(str(user.identity)),
-            "view_token": False
-        } for user in users]
+        "users": [format_user(user) for user in users]
     })
 
 
+#! /manage/user/list 未指定 fields 时返回的字段，与 /manage/user/getall 一致
+USER_LIST_DEFAULT_FIELDS: List[str] = [
+    "name", "user_id", "token", "email", "teamname", "leaders", "members", "contact", "identity"
+]
+
+
+def format_user(user: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    将 crud.list_users 返回的用户信息转换为前端列表使用的格式
+    """
+    if "email" in user and user["email"] is None:
+        user["email"] = "未提供邮箱"
+    if "identity" in user:
+        user["identity"] = identify(str(user["identity"]))
+    if "token" in user:
+        user["view_token"] = False
+    return user
+
+
+@router.get("/manage/user/list")
+async def user_list(
+    request: Request,
+    after: Optional[int] = None,
+    limit: int = 50,
+    identity: Optional[str] = None,
+    school: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+) -> JSONResponse:
+    """
+    使用游标分页获取用户信息
+
+    after:      上一页返回的 next，第一页不传
+    limit:      每页用户数，最大为 Config.USER_LIST_MAX_LIMIT
+    identity:   只返回该身份（Administrator/Team/VolunteerA/VolunteerB）的用户
+    school:     只返回该学校的用户
+    fields:     逗号分隔的字段列表，只查询并返回这些字段，默认与 /manage/user/getall 一致
+
+    返回的 next 为下一页的游标，没有下一页时为 null
+    """
+    if request.session.get("identity") != "Administrator":
+        return JSONResponse(content={
+            "msg": "权限不足！"
+        }, status_code=status.HTTP_403_FORBIDDEN)
+    field_list = USER_LIST_DEFAULT_FIELDS if fields is None else [field.strip() for field in fields.split(",") if field.strip()]
+    if unknown := [field for field in field_list if field not in crud.USER_LIST_FIELDS]:
+        return JSONResponse(content={
+            "msg": f"未知字段: {', '.join(unknown)}"
+        }, status_code=status.HTTP_400_BAD_REQUEST)
+    limit = max(1, min(limit, Config.USER_LIST_MAX_LIMIT))
+    users = await crud.list_users(db, field_list, after=after, limit=limit, identity=identity, school=school)
+    next_cursor = users[-1]["user_id"] if len(users) == limit else None
+    if "user_id" not in field_list:
+        for user in users:
+            user.pop("user_id")
+    return JSONResponse(content={
+        "users": [format_user(user) for user in users],
+        "next": next_cursor
+    }, status_code=status.HTTP_200_OK)
+
+
 @router.get("/manage/user/total")
 async def user_total(request: Request, db: AsyncSession = Depends(get_db)) -> JSONResponse:
     """
-    获取用户总数，最大值 25565
+    获取用户总数，以及各身份的用户数量
     """
     if request.session.get("identity") != "Administrator":
         return JSONResponse(content={
             "msg": "权限不足！"
         }, status_code=status.HTTP_403_FORBIDDEN)
-    users = await crud.get_all_users(db)
+    counts = await crud.count_users_by_identity(db)
     return JSONResponse(content={
-        "total": len([user for user in users])
+        "total": sum(counts.values()),
+        "identities": counts
+    }, status_code=status.HTTP_200_OK)
+
+
+@router.get("/manage/user/search")
+async def user_search(
+    request: Request,
+    q: str,
+    fuzzy: bool = False,
+    identity: Optional[str] = None,
+    offset: int = 0,
+    limit: int = 20,
+    db: AsyncSession = Depends(get_db)
+) -> JSONResponse:
+    """
+    在用户名、队伍名、学校、联系人和领队队员姓名中搜索用户
+
+    q:          关键词，匹配任意位置的子串（包括前缀）
+    fuzzy:      为 true 时容忍错别字，命中部分片段即可，按相关度排序
+    identity:   只返回该身份（Administrator/Team/VolunteerA/VolunteerB）的用户
+    offset:     跳过的结果数
+    limit:      每页结果数，最大为 Config.USER_LIST_MAX_LIMIT
+
+    返回结果总数 total 与下一页的 offset（没有下一页时为 null）
+    """
+    if request.session.get("identity") != "Administrator":
+        return JSONResponse(content={
+            "msg": "权限不足！"
+        }, status_code=status.HTTP_403_FORBIDDEN)
+    if not q.strip():
+        return JSONResponse(content={
+            "msg": "搜索关键词不能为空！"
+        }, status_code=status.HTTP_400_BAD_REQUEST)
+    offset = max(offset, 0)
+    limit = max(1, min(limit, Config.USER_LIST_MAX_LIMIT))
+    total, users = await crud.search_users(db, q, fuzzy=fuzzy, identity=identity, offset=offset, limit=limit)
+    return JSONResponse(content={
+        "users": [format_user(user) for user in users],
+        "total": total,
+        "next": offset + limit if offset + limit < total else None
     }, status_code=status.HTTP_200_OK)
 
 
@@ -412,47 +705,146 @@ async def user_search_id(id: str, request: Request, db: AsyncSession = Depends(g
         return JSONResponse(content={
             "msg": "未找到用户！"
         }, status_code=status.HTTP_404_NOT_FOUND)
+    roster = (await crud.get_team_members(db, [int(user_found.user_id)])).get(int(user_found.user_id), {})
     return JSONResponse(content={
         "name": user_found.name,
         "user_id": user_found.user_id,
         "token": user_found.token,
         "email": user_found.email if user_found.email is not None else "未提供邮箱",
         "teamname": user_found.teamname,
-        "leaders": user_found.leaders,
-        "members": user_found.members,
+        "leaders": roster.get("leaders", []),
+        "members": roster.get("members", []),
         "contact": user_found.contact,
         "identity": identify(str(user_found.identity)),
     })
 
 
+@router.get("/manage/team/members/count")
+async def team_members_count(request: Request, db: AsyncSession = Depends(get_db)) -> JSONResponse:
+    """
+    获取每支队伍的领队与队员人数
+    """
+    if request.session.get("identity") != "Administrator":
+        return JSONResponse(content={
+            "msg": "权限不足！"
+        }, status_code=status.HTTP_403_FORBIDDEN)
+    return JSONResponse(content={
+        "teams": await crud.count_team_members(db)
+    }, status_code=status.HTTP_200_OK)
+
+
+@router.get("/manage/team/members/school/{school}")
+async def team_members_school(school: str, request: Request, db: AsyncSession = Depends(get_db)) -> JSONResponse:
+    """
+    获取某个学校所有队伍的领队与队员
+    """
+    if request.session.get("identity") != "Administrator":
+        return JSONResponse(content={
+            "msg": "权限不足！"
+        }, status_code=status.HTTP_403_FORBIDDEN)
+    return JSONResponse(content={
+        "members": await crud.get_school_members(db, school)
+    }, status_code=status.HTTP_200_OK)
+
+
+@router.get("/manage/mail/status")
+async def mail_status(request: Request) -> JSONResponse:
+    """
+    获取后台邮件队列的统计信息与最近的发送记录
+    """
+    if request.session.get("identity") != "Administrator":
+        return JSONResponse(content={
+            "msg": "权限不足！"
+        }, status_code=status.HTTP_403_FORBIDDEN)
+    return JSONResponse(content={
+        "stats": mail_queue.stats(),
+        "jobs": list(reversed(mail_queue.jobs.values()))[:100]
+    }, status_code=status.HTTP_200_OK)
+
+
+@router.get("/manage/mail/status/{mail_id}")
+async def mail_status_id(mail_id: str, request: Request) -> JSONResponse:
+    """
+    获取某封邮件的发送状态
+    """
+    if request.session.get("identity") != "Administrator":
+        return JSONResponse(content={
+            "msg": "权限不足！"
+        }, status_code=status.HTTP_403_FORBIDDEN)
+    if (job := mail_queue.status(mail_id)) is None:
+        return JSONResponse(content={
+            "msg": "未找到该邮件！"
+        }, status_code=status.HTTP_404_NOT_FOUND)
+    return JSONResponse(content=job, status_code=status.HTTP_200_OK)
+
+
 @router.get("/manage/config/template")
 async def get_config_template(request: Request, db: AsyncSession = Depends(get_db)) -> Response:
     """
-    获取服务器配置模板
+    获取服务器配置模板，队伍信息未变化时返回缓存的内容，并支持 If-None-Match 协商缓存
     """
     if request.session.get("identity") != "Administrator":
         return JSONResponse(content={
             "msg": "权限不足！"
         }, status_code=status.HTTP_403_FORBIDDEN)
-    await crud.generate_config_template(db)
+    try:
+        version, content = await crud.generate_config_template(db)
+    except Exception:
+        console.print_exception()
+        return JSONResponse(content={
+            "msg": "生成配置模板失败！"
+        }, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    etag = f'"{version}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(
+        content=content,
+        media_type="application/vnd.ms-excel",
+        headers={**headers, "Content-Disposition": 'attachment; filename="config_template.xls"'},
+        status_code=status.HTTP_200_OK
+    )
+
+
+@router.get("/award")
+async def fetch_award(request: Request, db: AsyncSession = Depends(get_db)) -> Response:
+    """
+    获取已登录用户的奖项图片，使用 ETag 协商缓存，图片未变化时返回 304
+    """
+    if (user_id := request.session.get("user_id")) is None:
+        return JSONResponse(content={
+            "msg": "您尚未登录！"
+        }, status_code=status.HTTP_400_BAD_REQUEST)
+    digest = await crud.get_award_hash(db, user_id)
+    if digest is None or not crud.award_store.exists(digest):
+        return JSONResponse(content={
+            "msg": "暂无奖项信息！"
+        }, status_code=status.HTTP_404_NOT_FOUND)
+    headers = {
+        "ETag": f'"{digest}"',
+        "Cache-Control": "private, no-cache"
+    }
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
     return FileResponse(
-        path=Config.CONFIG_TEMPLATE_PATH,
-        filename="config_template.xls",
-        status_code=status.HTTP_200_OK,
+        path=crud.award_store.path(digest),
+        media_type=crud.award_store.media_type(digest, "image/png"),
+        headers=headers,
+        status_code=status.HTTP_200_OK
     )
 
 
 @router.post("/manage/user/award/upload")
-async def user_award_upload(request: Request, db: AsyncSession = Depends(get_db), files: bytes = File()) -> JSONResponse:
+async def user_award_upload(request: Request, db: AsyncSession = Depends(get_db), files: UploadFile = File(), user_id: int = Form(1)) -> JSONResponse:
     """
-    上传用户奖项信息
+    上传用户奖项信息，图片会以流的方式写入 blob 存储
     """
     if request.session.get("identity") != "Administrator":
         return JSONResponse(content={
             "msg": "权限不足！"
         }, status_code=status.HTTP_403_FORBIDDEN)
     try:
-        await crud.upload_user_award(db, files)
+        await crud.upload_user_award(db, files, user_id)
     except:
         console.print_exception()
         return JSONResponse(content={
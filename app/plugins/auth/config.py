@@ -1,6 +1,6 @@
 import os
 
-from typing import Dict, List
+from typing import Dict, List, Tuple
 
 
 class Config:
@@ -18,10 +18,35 @@ class Config:
     祝您在之后的比赛中收获愉快！
     （这是一封自动发送的邮件，请不要回复！）
 """
-    #! 配置模板存放位置
-    CONFIG_TEMPLATE_PATH: str = os.path.join(
+    #! 验证码有效期（秒），以及每个验证码最多允许的错误尝试次数
+    CAPTCHA_TTL: float = 600.0
+    CAPTCHA_MAX_ATTEMPTS: int = 5
+
+    #! 验证码发送的令牌桶限流规则：(桶容量, 恢复一个令牌所需秒数)
+    #? 同一邮箱每 30 秒一封
+    VERIFY_LIMIT_EMAIL: Tuple[int, float] = (1, 30.0)
+    #? 同一 IP 最多连续发送 5 封，之后每 60 秒一封
+    VERIFY_LIMIT_IP: Tuple[int, float] = (5, 60.0)
+    #? 所有请求合计最多连续发送 120 封，之后每秒一封，限制 SMTP 的总负载
+    VERIFY_LIMIT_GLOBAL: Tuple[int, float] = (120, 1.0)
+
+    #! 用户数量缓存的有效期（秒），多 worker 部署时，其他进程创建或删除的用户最多延迟这么久才会被计入
+    USER_COUNT_CACHE_TTL: float = 5.0
+
+    #! 用户信息缓存的容量与有效期（秒），多 worker 部署时，其他进程的修改最多延迟这么久才可见
+    USER_CACHE_SIZE: int = 4096
+    USER_CACHE_TTL: float = 5.0
+
+    #! 用户列表单页最多返回的用户数
+    USER_LIST_MAX_LIMIT: int = 1000
+
+    #! xls 格式每个工作表最多 65536 行，新建用户的凭据表格超出时分成多个工作表，每个工作表第一行为表头
+    CREDENTIALS_SHEET_ROWS: int = 65535
+
+    #! 奖项图片存放位置
+    AWARD_FOLDER: str = os.path.join(
         os.path.dirname(os.path.abspath(__file__)),
-        "config_template.xls"
+        "awards/"
     )
 
     #! 定义配置
@@ -1,15 +1,27 @@
-import xlwt
+import io
+import time
+import asyncio
 import hashlib
 
 from random import randint
-from base64 import b64encode
+from base64 import b64encode, b64decode
 from functools import reduce
-from sqlalchemy import select, update
+from sqlalchemy import select, update, insert, delete, func, text
+from fastapi import UploadFile
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import Iterable, List, Dict, Optional
+from typing import Iterable, List, Dict, Optional, Tuple, Set, Any
 
 from . import models, schemas
 from ..config import Config
+from ...utils.blob import BlobStore, iter_upload
+from ...utils.cache import TTLCache
+from ....manager import console
+
+
+award_store: BlobStore = BlobStore(Config.AWARD_FOLDER)
+# ("id", user_id) 或 ("name", name): 用户信息，不包含 award
+user_cache: TTLCache[schemas.User] = TTLCache("user", Config.USER_CACHE_SIZE, Config.USER_CACHE_TTL)
 
 
 def encrypter(victim: str, salt: str) -> str:
@@ -27,42 +39,27 @@ def encrypter(victim: str, salt: str) -> str:
     return encrypted.hexdigest()
 
 
-def str_encode(members: List[Dict[str, str]]) -> str:
-    """将成员列表转换为字符串
+#! 领队与队员信息的字段，顺序与旧版 ' - ' 分隔字符串中的顺序一致
+MEMBER_FIELDS: List[str] = ["name", "gender", "mobile", "identity", "academy", "profession", "qq", "email"]
 
-    Args:
-        members (List[Dict[str, str]]): 成员列表
 
-    Returns:
-        str: 转换成的字符串，字段之间用 ' - ' 隔开，成员之间用 ' | ' 隔开
-    """
-    def to_str(member: Dict[str, str]) -> str:
-        return f"{member['name']} - {member['gender']} - {member['mobile']} - {member['identity']} - {member['academy']} - {member['profession']} - {member['qq']} - {member['email']}"
-    return " | ".join([to_str(member) for member in members])
-
-
-def str_decode(members_str: str) -> List[Dict[str, str]]:
-    """将字符串转换为成员列表
+def str_decode(members_str: Optional[str]) -> List[Dict[str, str]]:
+    """将旧版字符串转换为成员列表，只用于迁移旧数据
 
     Args:
-        members_str (str): 成员列表字符串
+        members_str (Optional[str]): 成员列表字符串
 
     Returns:
         List[Dict[str, str]]: 转换出的成员列表
     """
     def from_str(member: str) -> Dict[str, str]:
         values = member.split(' - ')
-        return {
-            "name": values[0],
-            "gender": values[1],
-            "mobile": values[2],
-            "identity": values[3],
-            "academy": values[4],
-            "profession": values[5],
-            "qq": values[6],
-            "email": values[7]
-        }
-    if members_str == "None" or members_str == "":
+        # 字段中含有 ' - ' 时会被多拆出几段，多出的部分合并到最后一个字段，缺少的字段为空
+        if len(values) > len(MEMBER_FIELDS):
+            values = values[:len(MEMBER_FIELDS) - 1] + [' - '.join(values[len(MEMBER_FIELDS) - 1:])]
+        values += [""] * (len(MEMBER_FIELDS) - len(values))
+        return dict(zip(MEMBER_FIELDS, values))
+    if members_str is None or members_str == "None" or members_str == "":
         return []
     members = members_str.split(' | ')
     return [from_str(member) for member in members]
@@ -98,6 +95,124 @@ async def get_user_by_name(db: AsyncSession, name: str) -> Optional[models.User]
     return (await db.execute(select(models.User).where(models.User.name == name))).scalars().first()
 
 
+def invalidate_user(user_id: Optional[int] = None, name: Optional[str] = None) -> None:
+    """
+    使用户信息缓存失效，只提供 user_id 时会一并清除该用户按用户名缓存的项
+    """
+    if user_id is not None:
+        if (cached := user_cache.pop(("id", user_id))) is not None:
+            user_cache.pop(("name", cached.name))
+    if name is not None:
+        if (cached := user_cache.pop(("name", name))) is not None:
+            user_cache.pop(("id", cached.user_id))
+
+
+async def _cache_user(db: AsyncSession, user: Optional[models.User]) -> Optional[schemas.User]:
+    if user is None:
+        return None
+    profile = schemas.User.model_validate(user)
+    if (roster := (await get_team_members(db, [profile.user_id])).get(profile.user_id)) is not None:
+        profile.leaders = roster["leaders"]
+        profile.members = roster["members"]
+    user_cache.set(("id", profile.user_id), profile)
+    user_cache.set(("name", profile.name), profile)
+    return profile
+
+
+async def get_user_profile(db: AsyncSession, user_id: int) -> Optional[schemas.User]:
+    """
+    通过用户 id 获取用户信息，优先从缓存读取，返回的对象与数据库会话无关，只读
+    """
+    if (cached := user_cache.get(("id", user_id))) is not None:
+        return cached
+    return await _cache_user(db, await get_user(db, user_id))
+
+
+async def get_user_profile_by_name(db: AsyncSession, name: str) -> Optional[schemas.User]:
+    """
+    通过用户名获取用户信息，优先从缓存读取，返回的对象与数据库会话无关，只读
+    """
+    if (cached := user_cache.get(("name", name))) is not None:
+        return cached
+    return await _cache_user(db, await get_user_by_name(db, name))
+
+
+def _member_dict(member: Any) -> Dict[str, str]:
+    return {field: "" if (value := getattr(member, field)) is None else str(value) for field in MEMBER_FIELDS}
+
+
+async def get_team_members(db: AsyncSession, user_ids: List[int], chunk_size: int = 500) -> Dict[int, Dict[str, List[Dict[str, str]]]]:
+    """
+    批量获取队伍的领队与队员，返回 user_id: {"leaders": [...], "members": [...]}，没有成员信息的队伍不在结果中
+    """
+    rosters: Dict[int, Dict[str, List[Dict[str, str]]]] = {}
+    for i in range(0, len(user_ids), chunk_size):
+        members = (await db.execute(
+            select(models.TeamMember)
+            .where(models.TeamMember.user_id.in_(user_ids[i:i + chunk_size]))
+            .order_by(models.TeamMember.user_id, models.TeamMember.role, models.TeamMember.position)
+        )).scalars().all()
+        for member in members:
+            roster = rosters.setdefault(int(member.user_id), {"leaders": [], "members": []})
+            roster["leaders" if member.role == "leader" else "members"].append(_member_dict(member))
+    return rosters
+
+
+async def set_team_members(db: AsyncSession, user_id: int, leaders: List[Dict[str, str]], members: List[Dict[str, str]]) -> None:
+    """
+    用新的领队与队员列表替换队伍原有的成员信息，不提交事务
+    """
+    await db.execute(delete(models.TeamMember).where(models.TeamMember.user_id == user_id))
+    rows = [{
+        "user_id": user_id,
+        "role": role,
+        "position": position,
+        **{field: str(member.get(field, "")) for field in MEMBER_FIELDS}
+    } for role, people in (("leader", leaders), ("member", members)) for position, member in enumerate(people)]
+    if rows:
+        await db.execute(insert(models.TeamMember), rows)
+
+
+async def get_school_members(db: AsyncSession, school: str) -> List[Dict[str, str]]:
+    """
+    获取某个学校所有队伍的领队与队员，附带所属队伍的用户名、队伍名和角色
+    """
+    rows = (await db.execute(
+        select(models.TeamMember, models.User.name, models.User.teamname)
+        .join(models.User, models.User.user_id == models.TeamMember.user_id)
+        .where(models.User.school == school)
+        .order_by(models.TeamMember.user_id, models.TeamMember.role, models.TeamMember.position)
+    )).all()
+    return [{
+        "team": str(name),
+        "teamname": "" if teamname is None else str(teamname),
+        "role": str(member.role),
+        **_member_dict(member)
+    } for member, name, teamname in rows]
+
+
+async def count_team_members(db: AsyncSession) -> List[Dict[str, Any]]:
+    """
+    在数据库中统计每支队伍的领队与队员人数，没有成员信息的队伍人数为 0
+    """
+    leader_count = func.count(models.TeamMember.member_id).filter(models.TeamMember.role == "leader")
+    member_count = func.count(models.TeamMember.member_id).filter(models.TeamMember.role == "member")
+    rows = (await db.execute(
+        select(models.User.user_id, models.User.name, models.User.school, leader_count, member_count)
+        .outerjoin(models.TeamMember, models.TeamMember.user_id == models.User.user_id)
+        .where(models.User.identity == "Team")
+        .group_by(models.User.user_id)
+        .order_by(models.User.user_id)
+    )).all()
+    return [{
+        "user_id": user_id,
+        "name": name,
+        "school": school,
+        "leaders": leaders,
+        "members": members
+    } for user_id, name, school, leaders, members in rows]
+
+
 async def get_user_by_identity(db: AsyncSession, identity: str) -> Optional[models.User]:
     """
     获取第一个身份为 identity 的用户（用来查找是否存在指定身份的用户）
@@ -126,6 +241,119 @@ async def get_all_users(db: AsyncSession, skip: int = 0, limit: int = 25565) ->
     return (await db.execute(select(models.User).offset(skip).limit(limit).order_by(models.User.user_id))).scalars().all()
 
 
+#! 可以在用户列表中查询的字段，award 体积过大，不允许在列表中查询
+USER_LIST_FIELDS: List[str] = [
+    "user_id", "name", "email", "token", "identity", "teamname",
+    "contact", "leaders", "members", "school", "tel"
+]
+
+
+async def list_users(
+    db: AsyncSession,
+    fields: List[str],
+    after: Optional[int] = None,
+    skip: int = 0,
+    limit: int = 100,
+    identity: Optional[str] = None,
+    school: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    按 user_id 顺序获取用户列表，只查询 fields 中的字段（总会包含 user_id）
+
+    Args:
+        fields (List[str]): 需要的字段，必须都在 USER_LIST_FIELDS 中
+        after (Optional[int]): 游标，只返回 user_id 大于它的用户，深分页也只需要走主键索引
+        skip (int): 未提供游标时跳过的用户数
+        limit (int): 最多返回的用户数
+        identity (Optional[str]): 只返回该身份的用户
+        school (Optional[str]): 只返回该学校的用户
+    """
+    # 领队与队员保存在 team_members 中，查询完用户后再批量获取
+    columns = ["user_id"] + [field for field in fields if field not in ("user_id", "leaders", "members")]
+    query = select(*[getattr(models.User, column) for column in columns])
+    if identity is not None:
+        query = query.where(models.User.identity == identity)
+    if school is not None:
+        query = query.where(models.User.school == school)
+    if after is not None:
+        query = query.where(models.User.user_id > after)
+    else:
+        query = query.offset(skip)
+    rows = (await db.execute(query.order_by(models.User.user_id).limit(limit))).all()
+    users = [dict(zip(columns, row)) for row in rows]
+    if roster_fields := [field for field in ("leaders", "members") if field in fields]:
+        rosters = await get_team_members(db, [user["user_id"] for user in users])
+        for user in users:
+            roster = rosters.get(user["user_id"], {"leaders": [], "members": []})
+            for field in roster_fields:
+                user[field] = roster[field]
+    return users
+
+
+#! 已登录用户可以查询的自己的字段，不包含 token 与 award
+USER_DATA_FIELDS: List[str] = [
+    "user_id", "name", "email", "identity", "teamname", "contact",
+    "leaders", "members", "school", "tel", "award_hash"
+]
+
+
+async def get_user_fields(db: AsyncSession, user_id: int, fields: List[str]) -> Optional[Dict[str, Any]]:
+    """
+    只查询一个用户的 fields 字段（必须都在 USER_DATA_FIELDS 中），用户不存在时返回 None
+    """
+    # 领队与队员保存在 team_members 中，单独查询
+    columns = [field for field in fields if field not in ("leaders", "members")]
+    row = (await db.execute(
+        select(models.User.user_id, *[getattr(models.User, column) for column in columns])
+        .where(models.User.user_id == user_id)
+    )).first()
+    if row is None:
+        return None
+    data = dict(zip(columns, row[1:]))
+    if roster_fields := [field for field in ("leaders", "members") if field in fields]:
+        roster = (await get_team_members(db, [user_id])).get(user_id, {"leaders": [], "members": []})
+        for field in roster_fields:
+            data[field] = roster[field]
+    return data
+
+
+# (缓存时间, 身份: 用户数量)，创建或删除用户时失效
+_user_count_cache: Optional[Tuple[float, Dict[str, int]]] = None
+
+
+def invalidate_user_count() -> None:
+    """
+    使用户数量缓存失效
+    """
+    global _user_count_cache
+    _user_count_cache = None
+
+
+async def count_users_by_identity(db: AsyncSession) -> Dict[str, int]:
+    """
+    获取各身份的用户数量，结果会缓存 Config.USER_COUNT_CACHE_TTL 秒
+    """
+    global _user_count_cache
+    if _user_count_cache is not None and time.monotonic() - _user_count_cache[0] < Config.USER_COUNT_CACHE_TTL:
+        return dict(_user_count_cache[1])
+    rows = (await db.execute(
+        select(models.User.identity, func.count()).group_by(models.User.identity)
+    )).all()
+    counts = {str(identity): count for identity, count in rows}
+    _user_count_cache = (time.monotonic(), counts)
+    return dict(counts)
+
+
+async def count_users(db: AsyncSession, identity: Optional[str] = None) -> int:
+    """
+    获取用户数量，指定 identity 时只统计该身份的用户
+    """
+    counts = await count_users_by_identity(db)
+    if identity is not None:
+        return counts.get(identity, 0)
+    return sum(counts.values())
+
+
 async def create_user(db: AsyncSession, user: schemas.UserCreate) -> Optional[models.User]:
     """
     创建一个用户信息，提供的密码会自动加密，如果无法创建，返回 None
@@ -136,107 +364,442 @@ async def create_user(db: AsyncSession, user: schemas.UserCreate) -> Optional[mo
     new_user = models.User(**user.model_dump())
     db.add(new_user)
     await db.commit()
+    invalidate_user_count()
+    invalidate_user(name=user.name)
     await db.refresh(new_user)
     return new_user
 
 
+async def get_existing_names(db: AsyncSession, names: List[str], chunk_size: int = 500) -> Set[str]:
+    """
+    返回 names 中已经存在的用户名，按 chunk_size 分批使用 IN 查询，避免超出 SQLite 的参数数量上限
+    """
+    existing: Set[str] = set()
+    for i in range(0, len(names), chunk_size):
+        existing.update(
+            (await db.execute(
+                select(models.User.name).where(models.User.name.in_(names[i:i + chunk_size]))
+            )).scalars().all()
+        )
+    return existing
+
+
+async def create_users(db: AsyncSession, users: List[schemas.UserCreate]) -> List[schemas.UserCreate]:
+    """
+    在同一个事务中批量创建用户，已经存在的用户名会被跳过，提供的密码会自动加密
+
+    Returns:
+        List[schemas.UserCreate]: 实际创建的用户（密码为明文，用于分发）
+    """
+    existing = await get_existing_names(db, [user.name for user in users])
+    created: List[schemas.UserCreate] = []
+    for user in users:
+        if user.name in existing:
+            continue
+        # 同一批次中的重复用户名只创建第一个
+        existing.add(user.name)
+        created.append(user)
+    if not created:
+        return []
+    await db.execute(insert(models.User), [{
+        **user.model_dump(),
+        "token": b64encode(user.token.encode('utf-8')).decode('utf-8')
+    } for user in created])
+    await db.commit()
+    invalidate_user_count()
+    for user in created:
+        invalidate_user(name=user.name)
+    return created
+
+
+async def get_credentials(db: AsyncSession, names: List[str], chunk_size: int = 500) -> Dict[str, Tuple[str, Optional[str]]]:
+    """
+    按 chunk_size 分批查询 names 中存在的用户，返回 用户名: (明文密码, 数据库中保存的邮箱)
+    """
+    credentials: Dict[str, Tuple[str, Optional[str]]] = {}
+    for i in range(0, len(names), chunk_size):
+        for name, token, email in (await db.execute(
+            select(models.User.name, models.User.token, models.User.email)
+            .where(models.User.name.in_(names[i:i + chunk_size]))
+        )).all():
+            credentials[name] = (b64decode(token).decode('utf-8'), email)
+    return credentials
+
+
+def generate_credentials_sheet(users: List[schemas.UserCreate]) -> bytes:
+    """
+    生成包含用户名、密码、身份的 xls 表格，返回文件内容
+
+    每个工作表最多 Config.CREDENTIALS_SHEET_ROWS 个用户，超出时依次写入 用户信息2、用户信息3 ……
+    """
+    import xlwt
+
+    workbook: xlwt.Workbook = xlwt.Workbook(encoding="utf-8")
+    for index, begin in enumerate(range(0, max(len(users), 1), Config.CREDENTIALS_SHEET_ROWS)):
+        sheet: xlwt.Worksheet = workbook.add_sheet("用户信息" if index == 0 else f"用户信息{index + 1}")
+        for col, header in enumerate(["用户名", "密码", "身份"]):
+            sheet.write(0, col, header)
+        for row, user in enumerate(users[begin:begin + Config.CREDENTIALS_SHEET_ROWS], start=1):
+            sheet.write(row, 0, user.name)
+            sheet.write(row, 1, user.token)
+            sheet.write(row, 2, user.identity)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
 async def delete_user(db: AsyncSession, user_id: int) -> bool:
     """
     删除一个用户信息，返回是否成功
     """
     if (user := await get_user(db, user_id)) is None:
         return False
+    name = str(user.name)
+    await db.execute(delete(models.TeamMember).where(models.TeamMember.user_id == user_id))
     await db.delete(user)
     await db.commit()
+    invalidate_user_count()
+    invalidate_user(user_id=user_id, name=name)
     await db.flush()
     return True
 
 
-async def update_teaminfo(db: AsyncSession, user_id: int, leaders: str, members: str, school: str, contact: str, tel: str) -> None:
+async def update_teaminfo(
+    db: AsyncSession,
+    user_id: int,
+    leaders: List[Dict[str, str]],
+    members: List[Dict[str, str]],
+    school: str,
+    contact: str,
+    tel: str
+) -> None:
     """
-    更新用户团队信息
+    在同一个事务中更新用户团队信息与领队、队员列表
     """
+    await set_team_members(db, user_id, leaders, members)
     await db.execute(update(models.User).where(models.User.user_id == user_id).values({
-        models.User.leaders: leaders,
-        models.User.members: members,
         models.User.school: school,
         models.User.contact: contact,
         models.User.tel: tel
     }))
     await db.commit()
+    invalidate_user(user_id=user_id)
     await db.flush()
 
 
-async def generate_config_template(db: AsyncSession) -> bool:
+# 配置模板缓存：(版本, xls 文件内容)
+_config_template_cache: Optional[Tuple[str, bytes]] = None
+_config_template_lock: asyncio.Lock = asyncio.Lock()
+
+
+def build_config_template(teams: List[Tuple[str, str, List[str]]]) -> bytes:
     """
-    生成配置文件模板，返回是否成功
+    根据 (学校名, 队伍用户名, 队员性别列表) 列表在内存中生成配置文件模板，返回 xls 文件内容
     """
-    try:
-        workbook: xlwt.Workbook = xlwt.Workbook(encoding="utf-8")
-        team_infos = await get_all_users_by_identity(db, "Team")
-        team_infos = sorted(team_infos, key=lambda x: str(x.school))
-
-        #? 配置表
-        sheet_config: xlwt.Worksheet = workbook.add_sheet("软件配置")
-        index: int = -1
-        for key, value in Config.CONFIG_DEFAULT.items():
-            index += 1
-            sheet_config.write(index, 0, key)
-            sheet_config.write(index, 1, value)
-
-        #? 赛题信息
-        sheet_info: xlwt.Worksheet = workbook.add_sheet("赛题信息")
-        sheet_info.write(0, 0, "题号")
-        sheet_info.write(0, 1, "题名")
-
-        #? 队伍信息
-        sheet_team: xlwt.Worksheet = workbook.add_sheet("队伍信息")
-        index = -1
-        for header in Config.TEAMINFO_HEADERS:
-            index += 1
-            sheet_team.write(0, index, header)
-        index = 0
-        for team in team_infos:
-            index += 1
-            sheet_team.write(index, 0, str(team.school))
-            sheet_team.write(index, 1, str(team.name))
-            members: List[Dict[str, str]] = str_decode(str(team.members))
-            i = 0
-            for member in members:
-                i += 1
-                sheet_team.write(index, i * 2, f"{i}号选手")
-                sheet_team.write(index, 1 + i * 2, member["gender"])
-
-        #? 裁判信息
-        sheet_judge: xlwt.Worksheet = workbook.add_sheet("裁判信息")
-        sheet_judge.write(0, 0, "学校名")
-        sheet_judge.write(0, 1, "裁判们（一空一个，请不要全部放在一个单元格中）")
-
-        #? 队伍题库
-        sheet_problem_set: xlwt.Worksheet = workbook.add_sheet("队伍题库")
-        sheet_problem_set.write(0, 0, "学校名")
-        sheet_problem_set.write(0, 1, "队伍名")
-        sheet_problem_set.write(0, 2, "题库")
-        sheet_problem_set.write(0, 3, "注：此表单为队伍的题库表单，用于不采用拒题而选择直接给出题库的比赛规则。若不需要此功能则不需要填写任何内容，也不要删除此表单。题库输入规则为题号用逗号隔开，例如：1,2,10 此处逗号半角圆角都可以")
-        index = 0
-        for team in team_infos:
-            index += 1
-            sheet_problem_set.write(index, 0, str(team.school))
-            sheet_problem_set.write(index, 1, str(team.name))
-
-        workbook.save(Config.CONFIG_TEMPLATE_PATH)
-
-        return True
-    finally:
-        return False
-
+    import xlwt
+
+    workbook: xlwt.Workbook = xlwt.Workbook(encoding="utf-8")
+
+    #? 配置表
+    sheet_config: xlwt.Worksheet = workbook.add_sheet("软件配置")
+    index: int = -1
+    for key, value in Config.CONFIG_DEFAULT.items():
+        index += 1
+        sheet_config.write(index, 0, key)
+        sheet_config.write(index, 1, value)
+
+    #? 赛题信息
+    sheet_info: xlwt.Worksheet = workbook.add_sheet("赛题信息")
+    sheet_info.write(0, 0, "题号")
+    sheet_info.write(0, 1, "题名")
+
+    #? 队伍信息
+    sheet_team: xlwt.Worksheet = workbook.add_sheet("队伍信息")
+    index = -1
+    for header in Config.TEAMINFO_HEADERS:
+        index += 1
+        sheet_team.write(0, index, header)
+    index = 0
+    for school, name, genders in teams:
+        index += 1
+        sheet_team.write(index, 0, school)
+        sheet_team.write(index, 1, name)
+        i = 0
+        for gender in genders:
+            i += 1
+            sheet_team.write(index, i * 2, f"{i}号选手")
+            sheet_team.write(index, 1 + i * 2, gender)
+
+    #? 裁判信息
+    sheet_judge: xlwt.Worksheet = workbook.add_sheet("裁判信息")
+    sheet_judge.write(0, 0, "学校名")
+    sheet_judge.write(0, 1, "裁判们（一空一个，请不要全部放在一个单元格中）")
+
+    #? 队伍题库
+    sheet_problem_set: xlwt.Worksheet = workbook.add_sheet("队伍题库")
+    sheet_problem_set.write(0, 0, "学校名")
+    sheet_problem_set.write(0, 1, "队伍名")
+    sheet_problem_set.write(0, 2, "题库")
+    sheet_problem_set.write(0, 3, "注：此表单为队伍的题库表单，用于不采用拒题而选择直接给出题库的比赛规则。若不需要此功能则不需要填写任何内容，也不要删除此表单。题库输入规则为题号用逗号隔开，例如：1,2,10 此处逗号半角圆角都可以")
+    index = 0
+    for school, name, _ in teams:
+        index += 1
+        sheet_problem_set.write(index, 0, school)
+        sheet_problem_set.write(index, 1, name)
+
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+async def generate_config_template(db: AsyncSession) -> Tuple[str, bytes]:
+    """
+    获取配置文件模板，返回 (版本, xls 文件内容)
 
-async def upload_user_award(db: AsyncSession, file: bytes) -> None:
-    """上传获奖信息"""
-    img_str = b64encode(file).decode('utf-8')
-    img_str = "data:image/png;base64," + img_str
-    await db.execute(update(models.User).where(models.User.user_id == 1).values({
-        models.User.award: img_str
+    版本是模板所用队伍数据（学校、用户名与队员性别）的 sha256，只查询模板需要的字段来计算；
+    版本不变时直接返回缓存的内容，变化时在线程中重新生成，多 worker 部署时各进程得到的版本一致
+    """
+    global _config_template_cache
+    genders: Dict[int, List[str]] = {}
+    for user_id, gender in (await db.execute(
+        select(models.TeamMember.user_id, models.TeamMember.gender)
+        .join(models.User, models.User.user_id == models.TeamMember.user_id)
+        .where(models.User.identity == "Team", models.TeamMember.role == "member")
+        .order_by(models.TeamMember.user_id, models.TeamMember.position)
+    )).all():
+        genders.setdefault(user_id, []).append("" if gender is None else str(gender))
+    teams: List[Tuple[str, str, List[str]]] = sorted([
+        (str(school), str(name), genders.get(user_id, [])) for user_id, school, name in (await db.execute(
+            select(models.User.user_id, models.User.school, models.User.name)
+            .where(models.User.identity == "Team")
+            .order_by(models.User.user_id)
+        )).all()
+    ], key=lambda x: x[0])
+    version = hashlib.sha256(repr((Config.CONFIG_DEFAULT, Config.TEAMINFO_HEADERS, teams)).encode('utf-8')).hexdigest()
+    if _config_template_cache is not None and _config_template_cache[0] == version:
+        return _config_template_cache
+    # 同时到达的请求只生成一次
+    async with _config_template_lock:
+        if _config_template_cache is None or _config_template_cache[0] != version:
+            _config_template_cache = (version, await asyncio.to_thread(build_config_template, teams))
+        return _config_template_cache
+
+
+async def upload_user_award(db: AsyncSession, file: UploadFile, user_id: int = 1) -> str:
+    """
+    将奖项图片流式写入 blob 存储，并更新用户的 award_hash，返回 blob 标识
+    """
+    digest = await award_store.save_stream(iter_upload(file))
+    await db.execute(update(models.User).where(models.User.user_id == user_id).values({
+        models.User.award_hash: digest,
+        models.User.award: None
     }))
     await db.commit()
+    invalidate_user(user_id=user_id)
     await db.flush()
+    return digest
+
+
+async def get_award_hash(db: AsyncSession, user_id: int) -> Optional[str]:
+    """
+    获取用户奖项图片的 blob 标识，不存在时返回 None
+    """
+    return (await db.execute(
+        select(models.User.award_hash).where(models.User.user_id == user_id)
+    )).scalars().first()
+
+
+async def migrate_awards(db: AsyncSession) -> int:
+    """
+    将旧版保存在 award 字段中的 base64 data url 迁移到 blob 存储，返回迁移的用户数
+    """
+    rows = (await db.execute(
+        select(models.User.user_id, models.User.award)
+        .where(models.User.award.is_not(None), models.User.award_hash.is_(None))
+    )).all()
+    for user_id, award in rows:
+        digest = await award_store.save_bytes(b64decode(str(award).split(",", 1)[-1]))
+        await db.execute(update(models.User).where(models.User.user_id == user_id).values({
+            models.User.award_hash: digest,
+            models.User.award: None
+        }))
+    await db.commit()
+    return len(rows)
+
+
+async def migrate_team_members(db: AsyncSession) -> int:
+    """
+    将旧版保存在 leaders、members 字段中的 ' - ' / ' | ' 分隔字符串迁移到 team_members 表，返回迁移的用户数
+    """
+    rows = (await db.execute(
+        select(models.User.user_id, models.User.legacy_leaders, models.User.legacy_members)
+        .where((models.User.legacy_leaders.is_not(None)) | (models.User.legacy_members.is_not(None)))
+    )).all()
+    for user_id, leaders, members in rows:
+        await set_team_members(db, user_id, str_decode(leaders), str_decode(members))
+        await db.execute(update(models.User).where(models.User.user_id == user_id).values({
+            models.User.legacy_leaders: None,
+            models.User.legacy_members: None
+        }))
+    await db.commit()
+    return len(rows)
+
+
+# 用户搜索索引：rowid 与 users.user_id 一致，members 为领队与队员姓名，用空格连接
+# trigram 分词器按三个字符切分，可以匹配任意位置的子串（包括中文），由触发器在每次写入时同步
+SEARCH_INDEX_DDL: List[str] = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS user_search USING fts5(
+        name, teamname, school, contact, members, tokenize = 'trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS user_search_users_insert AFTER INSERT ON users BEGIN
+        INSERT INTO user_search (rowid, name, teamname, school, contact, members) VALUES (
+            new.user_id, new.name, new.teamname, new.school, new.contact,
+            (SELECT group_concat(name, ' ') FROM team_members WHERE user_id = new.user_id)
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS user_search_users_update AFTER UPDATE OF name, teamname, school, contact ON users BEGIN
+        UPDATE user_search SET name = new.name, teamname = new.teamname, school = new.school, contact = new.contact
+        WHERE rowid = new.user_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS user_search_users_delete AFTER DELETE ON users BEGIN
+        DELETE FROM user_search WHERE rowid = old.user_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS user_search_members_insert AFTER INSERT ON team_members BEGIN
+        UPDATE user_search SET members = (SELECT group_concat(name, ' ') FROM team_members WHERE user_id = new.user_id)
+        WHERE rowid = new.user_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS user_search_members_update AFTER UPDATE OF name ON team_members BEGIN
+        UPDATE user_search SET members = (SELECT group_concat(name, ' ') FROM team_members WHERE user_id = new.user_id)
+        WHERE rowid = new.user_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS user_search_members_delete AFTER DELETE ON team_members BEGIN
+        UPDATE user_search SET members = (SELECT group_concat(name, ' ') FROM team_members WHERE user_id = old.user_id)
+        WHERE rowid = old.user_id;
+    END
+    """,
+]
+
+# 全文索引是否可用，创建失败时 search_users 退回到 LIKE 扫描
+search_index_available: bool = False
+
+#! trigram 分词器需要的最低 SQLite 版本
+SEARCH_INDEX_MIN_SQLITE = (3, 34, 0)
+
+#! 搜索结果中返回的字段
+USER_SEARCH_FIELDS: List[str] = ["user_id", "name", "email", "identity", "teamname", "school", "contact"]
+
+
+async def rebuild_search_index(db: AsyncSession) -> None:
+    """
+    根据 users 与 team_members 重建用户搜索索引，不提交事务
+    """
+    await db.execute(text("DELETE FROM user_search"))
+    await db.execute(text("""
+        INSERT INTO user_search (rowid, name, teamname, school, contact, members)
+        SELECT user_id, name, teamname, school, contact,
+            (SELECT group_concat(team_members.name, ' ') FROM team_members WHERE team_members.user_id = users.user_id)
+        FROM users
+    """))
+
+
+async def create_search_index(db: AsyncSession) -> bool:
+    """
+    创建用户搜索索引及同步触发器，索引是新建的（或触发器缺失）时用已有数据填充，返回是否填充了索引
+
+    SQLite 低于 3.34 或没有编译 FTS5 时不创建索引（并删除之前留下的触发器），只输出日志，搜索退回到 LIKE 扫描
+    """
+    global search_index_available
+    search_index_available = False
+    version = (await db.execute(text("SELECT sqlite_version()"))).scalar_one()
+    try:
+        if tuple(int(part) for part in version.split(".")[:3]) < SEARCH_INDEX_MIN_SQLITE:
+            raise RuntimeError(f"SQLite 版本 {version} 不支持 trigram 分词器")
+        # 触发器缺失时（之前退回过 LIKE 扫描）索引可能已经过时，同样需要重建
+        exists = (await db.execute(text(
+            "SELECT count(*) FROM sqlite_master WHERE (type = 'table' AND name = 'user_search') "
+            "OR (type = 'trigger' AND name = 'user_search_users_insert')"
+        ))).scalar_one() == 2
+        for statement in SEARCH_INDEX_DDL:
+            await db.execute(text(statement))
+        if not exists:
+            await rebuild_search_index(db)
+        await db.commit()
+    except (OperationalError, RuntimeError) as e:
+        await db.rollback()
+        # 之前用支持 FTS5 的 SQLite 创建的触发器会让 users 的写入失败
+        for trigger in ("users_insert", "users_update", "users_delete", "members_insert", "members_update", "members_delete"):
+            await db.execute(text(f"DROP TRIGGER IF EXISTS user_search_{trigger}"))
+        await db.commit()
+        console.log(f"[yellow]未创建[/yellow] 用户全文索引，搜索将使用 LIKE 扫描: {e}")
+        return False
+    search_index_available = True
+    return not exists
+
+
+def _fts_phrase(value: str) -> str:
+    # FTS5 的字符串用双引号包裹，内部的双引号写两次，避免用户输入被当作查询语法
+    return '"' + value.replace('"', '""') + '"'
+
+
+async def search_users(
+    db: AsyncSession,
+    keyword: str,
+    fuzzy: bool = False,
+    identity: Optional[str] = None,
+    offset: int = 0,
+    limit: int = 20
+) -> Tuple[int, List[Dict[str, Any]]]:
+    """在用户名、队伍名、学校、联系人和领队队员姓名中搜索用户
+
+    Args:
+        keyword (str): 关键词，匹配任意字段中的子串（包括前缀）
+        fuzzy (bool): 为 True 时只要求命中关键词中的部分三字片段，用来容忍错别字，按相关度排序
+        identity (Optional[str]): 只返回该身份的用户
+        offset (int): 跳过的结果数
+        limit (int): 最多返回的结果数
+
+    Returns:
+        Tuple[int, List[Dict[str, Any]]]: (结果总数, 当前页的用户信息)
+    """
+    keyword = keyword.strip()
+    params: Dict[str, Any] = {"offset": offset, "limit": limit}
+    if search_index_available and len(keyword) >= 3:
+        if fuzzy:
+            grams = list(dict.fromkeys(keyword[i:i + 3] for i in range(len(keyword) - 2)))
+            params["query"] = " OR ".join(_fts_phrase(gram) for gram in grams)
+        else:
+            params["query"] = _fts_phrase(keyword)
+        source = "FROM user_search JOIN users ON users.user_id = user_search.rowid"
+        condition = "user_search MATCH :query"
+        order = "user_search.rank"
+    else:
+        # trigram 索引无法处理少于三个字符的关键词（索引不可用时也是如此），直接对用户表做 LIKE 扫描，数据量为几千时依旧很快
+        params["pattern"] = "%" + keyword.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        source = "FROM users"
+        columns = [f"users.{column}" for column in ["name", "teamname", "school", "contact"]]
+        members = "SELECT 1 FROM team_members WHERE team_members.user_id = users.user_id AND team_members.name LIKE :pattern ESCAPE '\\'"
+        condition = "(" + " OR ".join(f"{column} LIKE :pattern ESCAPE '\\'" for column in columns) + f" OR EXISTS ({members}))"
+        order = "users.user_id"
+    if identity is not None:
+        condition += " AND users.identity = :identity"
+        params["identity"] = identity
+    source = f"{source} WHERE {condition}"
+    total = (await db.execute(text(f"SELECT count(*) {source}"), params)).scalar_one()
+    rows = (await db.execute(text(
+        f"SELECT {', '.join('users.' + field for field in USER_SEARCH_FIELDS)} {source} "
+        f"ORDER BY {order} LIMIT :limit OFFSET :offset"
+    ), params)).all()
+    return int(total), [dict(zip(USER_SEARCH_FIELDS, row)) for row in rows]
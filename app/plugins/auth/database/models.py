@@ -1,4 +1,5 @@
-from sqlalchemy import Column, String, Integer
+from sqlalchemy import Column, ForeignKey, Index, String, Integer
+from sqlalchemy.orm import deferred
 
 from . import database
 
@@ -15,9 +16,10 @@ class User(database.Base):
         identity: 用户身份
         teamname: 队伍名称
         contact: 联系人名称(身份非队伍无效)
-        leaders: 领队信息(身份非队伍无效)格式：姓名 - 性别 - 手机号 - 身份证号 - 学院 - 专业 - QQ - 邮箱
-        members: 队员信息(身份非队伍无效)格式同领队信息，每个队员用 ' | ' 隔开
-        award: 奖项信息(身份非队伍无效)
+        legacy_leaders: 旧版领队信息，格式：姓名 - 性别 - 手机号 - 身份证号 - 学院 - 专业 - QQ - 邮箱，启动时会被迁移到 team_members，延迟加载
+        legacy_members: 旧版队员信息，格式同领队信息，每个队员用 ' | ' 隔开，启动时会被迁移到 team_members，延迟加载
+        award: 旧版奖项信息(base64 data url)，启动时会被迁移到 award_hash，延迟加载
+        award_hash: 奖项图片在 blob 存储中的 sha256 标识(身份非队伍无效)
         school: 学校名称
         tel: 联系人电话号码
     """
@@ -30,8 +32,46 @@ class User(database.Base):
     identity = Column(String(128))
     teamname = Column(String(128), unique=True)
     contact = Column(String(128))
-    leaders = Column(String(4096))
-    members = Column(String(4096))
-    award = Column(String(10485760))
+    legacy_leaders = deferred(Column("leaders", String(4096)))
+    legacy_members = deferred(Column("members", String(4096)))
+    award = deferred(Column(String(10485760)))
+    award_hash = Column(String(64))
     school = Column(String(128))
     tel = Column(String(32))
+
+
+class TeamMember(database.Base):
+    """
+    表: team_members，队伍的领队与队员(身份非队伍无效)
+
+    字段：
+        member_id: 唯一标识
+        user_id: 所属队伍的用户 id
+        role: leader（领队）/ member（队员）
+        position: 在同一队伍同一角色中的顺序
+        name: 姓名
+        gender: 性别
+        mobile: 手机号
+        identity: 身份证号
+        academy: 学院
+        profession: 专业
+        qq: QQ
+        email: 邮箱
+    """
+    __tablename__ = "team_members"
+    __table_args__ = (
+        Index("ix_team_members_user_role_position", "user_id", "role", "position"),
+    )
+
+    member_id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.user_id", ondelete="CASCADE"), nullable=False)
+    role = Column(String(16), nullable=False)
+    position = Column(Integer, nullable=False)
+    name = Column(String(128))
+    gender = Column(String(16))
+    mobile = Column(String(32))
+    identity = Column(String(32))
+    academy = Column(String(128))
+    profession = Column(String(128))
+    qq = Column(String(32))
+    email = Column(String(256))
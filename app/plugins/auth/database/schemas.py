@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Dict, List, Optional
 from pydantic import BaseModel
 
 
@@ -26,9 +26,9 @@ class User(UserBase):
     user_id: int
     teamname: Optional[str]
     contact: Optional[str]
-    leaders: Optional[str]
-    members: Optional[str]
-    award: Optional[str]
+    leaders: List[Dict[str, str]] = []
+    members: List[Dict[str, str]] = []
+    award_hash: Optional[str]
     school: Optional[str]
     tel: Optional[str]
 
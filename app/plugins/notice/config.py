@@ -0,0 +1,19 @@
+import os
+
+
+class Config:
+    #! 公告文件所在的文件夹，文件名为 notice{id}.html
+    NOTICE_FOLDER: str = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        "notices/"
+    )
+
+    #! 两次检查公告文件夹是否有变化的最短间隔（秒）
+    REFRESH_INTERVAL: float = 2.0
+
+    #! /notice/list 默认与最多返回的公告数
+    PAGE_SIZE: int = 10
+    MAX_PAGE_SIZE: int = 100
+
+    #! 公告摘要的最大长度
+    SUMMARY_LENGTH: int = 100
@@ -1,10 +1,58 @@
-import os
-import aiofiles
-
-from fastapi import status
-from fastapi.responses import PlainTextResponse
+from fastapi import Request, status
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional
 
 from . import router
+from .config import Config
+from .registry import notice_registry
+
+
+# 同等优先级时优先选择压缩率更高的编码
+_encoding_preference = ("br", "gzip")
+
+
+def _select_encoding(accept_encoding: str, variants: Dict[str, bytes]) -> Optional[str]:
+    """
+    根据 Accept-Encoding 从已有的压缩版本中选出 q 值最高的编码，都不接受时返回 None（不压缩）
+    """
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        weight = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding.strip().lower()] = weight
+    best: Optional[str] = None
+    best_weight = 0.0
+    for coding in _encoding_preference:
+        if coding in variants and (weight := weights.get(coding, weights.get("*", 0.0))) > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+def _not_modified(request: Request, item: Dict[str, Any]) -> bool:
+    """
+    判断客户端缓存的版本是否仍然有效，If-None-Match 存在时忽略 If-Modified-Since
+    """
+    if (if_none_match := request.headers.get("if-none-match")) is not None:
+        for tag in if_none_match.split(","):
+            tag = tag.strip().removeprefix("W/").strip('"')
+            # 各压缩版本的 ETag 为 "<内容哈希>-<编码>"，内容相同即视为有效
+            if tag == "*" or tag.partition("-")[0] == item["etag"]:
+                return True
+        return False
+    if (if_modified_since := request.headers.get("if-modified-since")) is not None:
+        try:
+            return int(item["mtime"]) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
 
 
 @router.get("/total")
@@ -12,36 +60,55 @@ async def notice_total() -> PlainTextResponse:
     """
     获取公告总数
     """
-    tot: int = 0
-    for i in range(1, 100):
-        if not os.path.exists(
-            os.path.join(
-                os.path.dirname(os.path.abspath(__file__)),
-                f"notices/notice{i}.html"
-            )
-        ):
-            break
-        tot += 1
-    return PlainTextResponse(str(tot), status_code=status.HTTP_200_OK)
+    return PlainTextResponse(str(await notice_registry.count()), status_code=status.HTTP_200_OK)
+
+
+@router.get("/list")
+async def notice_list(page: int = 1, size: int = Config.PAGE_SIZE) -> JSONResponse:
+    """
+    分页获取公告的标题与摘要
+
+    Args:
+        page (int): 页码，从 1 开始
+        size (int): 每页的公告数
+    """
+    size = max(1, min(size, Config.MAX_PAGE_SIZE))
+    page = max(1, page)
+    notices = await notice_registry.summaries((page - 1) * size, size)
+    return JSONResponse(content={
+        "total": notice_registry.total,
+        "page": page,
+        "size": size,
+        "notices": notices
+    }, status_code=status.HTTP_200_OK)
 
 
 @router.get("/{page}")
-async def notice(page: int) -> PlainTextResponse:
+async def notice(page: int, request: Request) -> Response:
     """
     获取指定编号的公告
 
+    响应带有 ETag 与 Last-Modified，客户端缓存有效时返回 304；
+    根据 Accept-Encoding 返回预先压缩好的 br / gzip 版本
+
     Args:
         page (int): 公告编号
     """
-    page_path = os.path.join(
-        os.path.dirname(os.path.abspath(__file__)),
-        f"notices/notice{page}.html"
-    )
-    if not os.path.exists(page_path):
+    if (item := await notice_registry.get(page)) is None:
         return PlainTextResponse(
             "",
             status_code=status.HTTP_404_NOT_FOUND
         )
-    async with aiofiles.open(page_path, "r", encoding="utf-8") as f:
-        content = await f.read()
-    return PlainTextResponse(content, status_code=status.HTTP_200_OK)
+    encoding = _select_encoding(request.headers.get("accept-encoding", ""), item["variants"])
+    headers = {
+        "ETag": f'"{item["etag"]}-{encoding}"' if encoding is not None else f'"{item["etag"]}"',
+        "Last-Modified": item["last_modified"],
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding"
+    }
+    if _not_modified(request, item):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if encoding is None:
+        return Response(item["body"], media_type="text/plain; charset=utf-8", headers=headers)
+    headers["Content-Encoding"] = encoding
+    return Response(item["variants"][encoding], media_type="text/plain; charset=utf-8", headers=headers)
@@ -0,0 +1,158 @@
+import os
+import re
+import gzip
+import html
+import time
+import asyncio
+import hashlib
+
+from email.utils import formatdate
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config import Config
+from ...manager import console
+
+
+_notice_name_pattern = re.compile(r"^notice([1-9][0-9]*)\.html$")
+_heading_pattern = re.compile(r"<(h[1-6]|title)\b[^>]*>(.*?)</\1\s*>", re.IGNORECASE | re.DOTALL)
+_block_pattern = re.compile(r"<(style|script)\b[^>]*>.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+_tag_pattern = re.compile(r"<[^>]+>")
+_space_pattern = re.compile(r"\s+")
+
+
+def _plain_text(content: str) -> str:
+    return _space_pattern.sub(" ", html.unescape(_tag_pattern.sub(" ", _block_pattern.sub(" ", content)))).strip()
+
+
+def compress_variants(body: bytes) -> Dict[str, bytes]:
+    """
+    返回 body 的压缩版本，键为 Content-Encoding，只保留比原文更小的版本
+
+    安装了 brotli 时同时生成 br 版本
+    """
+    variants: Dict[str, bytes] = {}
+    try:
+        import brotli
+        variants["br"] = brotli.compress(body, quality=11)
+    except ImportError:
+        pass
+    variants["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+    return {encoding: data for encoding, data in variants.items() if len(data) < len(body)}
+
+
+def load_notice(notice_id: int, path: str, stat: os.stat_result) -> Dict[str, Any]:
+    """
+    读取公告文件，提取标题（第一个标题标签）与摘要（去掉标签后的正文开头），
+    并计算 ETag 与压缩版本，每个文件版本只计算一次
+    """
+    with open(path, "rb") as file:
+        body = file.read()
+    content = body.decode("utf-8")
+    title = None
+    if (match := _heading_pattern.search(content)) is not None:
+        title = _plain_text(match.group(2)) or None
+    text = _plain_text(content)
+    if len(text) > Config.SUMMARY_LENGTH:
+        text = text[:Config.SUMMARY_LENGTH] + "…"
+    return {
+        "id": notice_id,
+        "title": title,
+        "summary": text,
+        "mtime": stat.st_mtime,
+        "size": stat.st_size,
+        "content": content,
+        "body": body,
+        "variants": compress_variants(body),
+        "etag": hashlib.sha256(body).hexdigest()[:32],
+        "last_modified": formatdate(stat.st_mtime, usegmt=True),
+        "version": (stat.st_mtime_ns, stat.st_size)
+    }
+
+
+class NoticeRegistry:
+    """
+    公告索引：扫描一次公告文件夹，把公告内容、标题与修改时间保存在内存中
+
+    每次访问时最多每 refresh_interval 秒检查一次文件夹，只重新读取新增或修改时间、大小变化的文件，
+    删除的文件会从索引中移除
+
+    公告编号从 1 开始连续计算，跳过某个编号时之后的公告不会显示（与原来的规则一致），但数量不再有上限
+
+    Args:
+        folder (str): 公告文件夹
+        refresh_interval (float): 两次检查的最短间隔（秒）
+    """
+    def __init__(self, folder: str, refresh_interval: float) -> None:
+        self.folder = folder
+        self.refresh_interval = refresh_interval
+        # 公告编号: 公告信息
+        self.notices: Dict[int, Dict[str, Any]] = {}
+        self.total: int = 0
+        self.checked_at: Optional[float] = None
+        self.lock = asyncio.Lock()
+
+    def scan(self) -> None:
+        """
+        重新扫描公告文件夹，在线程池中执行
+        """
+        found: Dict[int, Tuple[str, os.stat_result]] = {}
+        try:
+            with os.scandir(self.folder) as entries:
+                for entry in entries:
+                    if (match := _notice_name_pattern.match(entry.name)) is not None and entry.is_file():
+                        found[int(match.group(1))] = (entry.path, entry.stat())
+        except FileNotFoundError:
+            pass
+        notices: Dict[int, Dict[str, Any]] = {}
+        for notice_id, (path, stat) in found.items():
+            cached = self.notices.get(notice_id)
+            if cached is not None and cached["version"] == (stat.st_mtime_ns, stat.st_size):
+                notices[notice_id] = cached
+                continue
+            try:
+                notices[notice_id] = load_notice(notice_id, path, stat)
+            except (OSError, UnicodeDecodeError):
+                console.print_exception(show_locals=True)
+        total = 0
+        while total + 1 in notices:
+            total += 1
+        if notices.keys() != self.notices.keys() or any(notices[key] is not self.notices[key] for key in notices):
+            console.log(f"[green]已更新[/green] 公告索引: [yellow]{total}[/yellow] 条公告")
+        self.notices = notices
+        self.total = total
+
+    async def refresh(self) -> None:
+        """
+        距离上次检查超过 refresh_interval 秒时重新扫描公告文件夹
+        """
+        if self.checked_at is not None and time.monotonic() - self.checked_at < self.refresh_interval:
+            return
+        async with self.lock:
+            if self.checked_at is not None and time.monotonic() - self.checked_at < self.refresh_interval:
+                return
+            await asyncio.to_thread(self.scan)
+            self.checked_at = time.monotonic()
+
+    async def count(self) -> int:
+        await self.refresh()
+        return self.total
+
+    async def get(self, notice_id: int) -> Optional[Dict[str, Any]]:
+        await self.refresh()
+        return self.notices.get(notice_id)
+
+    async def summaries(self, offset: int, limit: int) -> List[Dict[str, Any]]:
+        """
+        返回编号从 offset + 1 开始的最多 limit 条公告的摘要
+        """
+        await self.refresh()
+        return [{
+            "id": notice_id,
+            "title": self.notices[notice_id]["title"],
+            "summary": self.notices[notice_id]["summary"],
+            "mtime": self.notices[notice_id]["mtime"],
+            "size": self.notices[notice_id]["size"]
+        } for notice_id in range(offset + 1, min(offset + limit, self.total) + 1)]
+
+
+notice_registry: NoticeRegistry = NoticeRegistry(Config.NOTICE_FOLDER, Config.REFRESH_INTERVAL)
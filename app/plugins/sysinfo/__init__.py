@@ -1,9 +1,25 @@
 from fastapi import APIRouter
+from typing import AsyncGenerator
+from contextlib import asynccontextmanager
+
+from .sampler import sampler
+from ..utils.profiling import LoopLagConfig, loop_lag_monitor
+
+
+@asynccontextmanager
+async def run_sampler(_: APIRouter) -> AsyncGenerator[None, None]:
+    sampler.start()
+    if LoopLagConfig.ENABLED:
+        loop_lag_monitor.start()
+    yield
+    await loop_lag_monitor.stop()
+    await sampler.stop()
 
 
 router = APIRouter(
     prefix="/sysinfo",
     tags=["sysinfo"],
+    lifespan=run_sampler
 )
 __router__ = router
 
@@ -0,0 +1,13 @@
+import os
+
+
+class Config:
+    #! 后台采样间隔（秒），可以用环境变量 SYSINFO_SAMPLE_INTERVAL 覆盖
+    SAMPLE_INTERVAL: float = float(os.getenv("SYSINFO_SAMPLE_INTERVAL") or 2.0)
+
+    #! 保留的采样条数，默认间隔下为一个小时
+    HISTORY_SIZE: int = 1800
+
+    #! /sysinfo/history 默认与最多返回的数据点数
+    HISTORY_POINTS: int = 120
+    HISTORY_MAX_POINTS: int = 1000
@@ -0,0 +1,163 @@
+import os
+import time
+import asyncio
+import threading
+
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from .config import Config
+from ...manager import console
+
+
+class SystemSampler:
+    """
+    后台定时采集系统指标，保存在固定长度的环形缓冲区中
+
+    每条采样包含 CPU 总占用与各核心占用、内存、磁盘与网络的读写速率以及本进程的常驻内存，
+    CPU 占用和各项速率都是相对于上一次采样计算的，与请求频率无关
+
+    Args:
+        interval (float): 采样间隔（秒）
+        size (int): 最多保留的采样条数
+    """
+    def __init__(self, interval: float, size: int) -> None:
+        self.interval = interval
+        self.samples: Deque[Dict[str, Any]] = deque(maxlen=size)
+        self.task: Optional[asyncio.Task] = None
+        self.process: Any = None
+        self.counters: Optional[Dict[str, float]] = None
+        # 采样会在线程中执行，请求处理时也可能补一次采样
+        self.lock = threading.Lock()
+
+    def read_counters(self) -> Dict[str, float]:
+        import psutil
+
+        disk = psutil.disk_io_counters()
+        net = psutil.net_io_counters()
+        return {
+            "time": time.time(),
+            "disk_read": float(disk.read_bytes) if disk is not None else 0.0,
+            "disk_write": float(disk.write_bytes) if disk is not None else 0.0,
+            "net_sent": float(net.bytes_sent) if net is not None else 0.0,
+            "net_recv": float(net.bytes_recv) if net is not None else 0.0,
+        }
+
+    def sample(self) -> Dict[str, Any]:
+        """
+        采集一次，会阻塞，需要在线程中调用
+        """
+        with self.lock:
+            return self._sample()
+
+    def prime(self) -> None:
+        """
+        设定 cpu_percent 与磁盘、网络计数的起点，下一次采样的结果是这之后的平均值
+        """
+        with self.lock:
+            self._prime()
+
+    def _prime(self) -> None:
+        import psutil
+
+        self.process = psutil.Process(os.getpid())
+        psutil.cpu_percent(percpu=True)
+        self.counters = self.read_counters()
+
+    def _sample(self) -> Dict[str, Any]:
+        import psutil
+
+        if self.process is None:
+            self._prime()
+        counters = self.read_counters()
+        assert self.counters is not None
+        elapsed = max(counters["time"] - self.counters["time"], 1e-6)
+        rates = {
+            f"{key}_rate": max(counters[key] - self.counters[key], 0.0) / elapsed
+            for key in ("disk_read", "disk_write", "net_sent", "net_recv")
+        }
+        self.counters = counters
+        per_core: List[float] = psutil.cpu_percent(percpu=True)
+        memory = psutil.virtual_memory()
+        cpu_freq = psutil.cpu_freq()
+        return {
+            "time": counters["time"],
+            "cpu_usage": sum(per_core) / len(per_core) if per_core else 0.0,
+            "cpu_per_core": per_core,
+            "cpu_counts": psutil.cpu_count(),
+            "cpu_freq": list(cpu_freq) if cpu_freq is not None else None,
+            "mem_total": float(memory.total) / float(10000),
+            "mem_usage": memory.percent,
+            "mem_used": memory.used,
+            **rates,
+            "process_rss": self.process.memory_info().rss,
+        }
+
+    async def run(self) -> None:
+        # 提前一个间隔设定起点，否则第一次采样的 CPU 占用是紧接着起点读取的，没有意义
+        try:
+            await asyncio.to_thread(self.prime)
+        except Exception:
+            console.print_exception(show_locals=True)
+        await asyncio.sleep(self.interval)
+        while True:
+            begin = time.monotonic()
+            try:
+                self.samples.append(await asyncio.to_thread(self.sample))
+            except Exception:
+                console.print_exception(show_locals=True)
+            await asyncio.sleep(max(self.interval - (time.monotonic() - begin), 0.0))
+
+    def start(self) -> None:
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    def latest(self) -> Optional[Dict[str, Any]]:
+        """
+        返回最近一次采样，尚未采样时返回 None
+        """
+        return self.samples[-1] if self.samples else None
+
+    def history(self, seconds: Optional[float] = None, points: int = Config.HISTORY_POINTS) -> List[Dict[str, Any]]:
+        """返回最近 seconds 秒（默认为全部）的采样，降采样到最多 points 个点
+
+        每个点是一段时间内各采样的平均值，cpu_per_core 按核心分别平均，time 为这段时间最后一次采样的时间
+
+        Args:
+            seconds (Optional[float]): 时间范围（秒）
+            points (int): 最多返回的点数
+
+        Returns:
+            List[Dict[str, Any]]: 按时间顺序排列的数据点
+        """
+        samples = list(self.samples)
+        if seconds is not None:
+            since = time.time() - seconds
+            samples = [sample for sample in samples if sample["time"] >= since]
+        if not samples or points <= 0:
+            return []
+        step = -(-len(samples) // points)
+        result: List[Dict[str, Any]] = []
+        for i in range(0, len(samples), step):
+            bucket = samples[i:i + step]
+            cores = [sample["cpu_per_core"] for sample in bucket]
+            point: Dict[str, Any] = {
+                key: sum(sample[key] for sample in bucket) / len(bucket)
+                for key in (
+                    "cpu_usage", "mem_usage", "mem_used", "disk_read_rate", "disk_write_rate",
+                    "net_sent_rate", "net_recv_rate", "process_rss"
+                )
+            }
+            point["time"] = bucket[-1]["time"]
+            point["cpu_per_core"] = [sum(values) / len(values) for values in zip(*cores)]
+            result.append(point)
+        return result
+
+
+sampler: SystemSampler = SystemSampler(Config.SAMPLE_INTERVAL, Config.HISTORY_SIZE)
@@ -1,27 +1,158 @@
-import psutil
+import os
+import asyncio
 
-from fastapi import status
-from fastapi.responses import JSONResponse
+from fastapi import Request, status
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response
+from typing import Optional
 
 from . import router
+from .config import Config
+from .sampler import sampler
+from ..utils.cache import caches
+from ..utils.database import databases, request_stats_snapshot
+from ..utils.ratelimit import rate_limiter
+from ..utils.profiling import list_profiles, loop_lag_monitor, profile_path, profile_summary
 
 
 @router.get("/")
-def sysinfo() -> JSONResponse:
+async def sysinfo() -> JSONResponse:
     """
-    返回服务器的系统信息
+    返回服务器的系统信息，为后台采样器最近一次的采样结果
     """
-    cpu_usage: float = psutil.cpu_percent()
-    cpu_cores: int = psutil.cpu_count()
-    cpu_freq: psutil.scpufreq = psutil.cpu_freq()
-    memory_usage: float = psutil.virtual_memory().percent
-    memory_total: float = float(psutil.virtual_memory().total) / float(10000)
+    if (sample := sampler.latest()) is None:
+        # 采样器刚刚启动，还没有完成第一次采样
+        sample = await asyncio.to_thread(sampler.sample)
+    return JSONResponse(content=sample, status_code=status.HTTP_200_OK)
+
+
+@router.get("/history")
+async def sysinfo_history(
+    request: Request,
+    seconds: Optional[float] = None,
+    points: int = Config.HISTORY_POINTS
+) -> JSONResponse:
+    """
+    返回最近 seconds 秒（默认为全部保留的采样）的系统指标，降采样到最多 points 个点
+    """
+    if request.session.get("identity") != "Administrator":
+        return JSONResponse(content={
+            "msg": "权限不足！"
+        }, status_code=status.HTTP_403_FORBIDDEN)
+    return JSONResponse(content={
+        "interval": sampler.interval,
+        "history": sampler.history(seconds, max(1, min(points, Config.HISTORY_MAX_POINTS)))
+    }, status_code=status.HTTP_200_OK)
+
+
+@router.get("/database")
+async def database_stats(request: Request) -> JSONResponse:
+    """
+    返回各数据库的连接池状态、语句耗时直方图、慢查询记录，以及每个路由的平均查询次数与耗时
+    """
+    if request.session.get("identity") != "Administrator":
+        return JSONResponse(content={
+            "msg": "权限不足！"
+        }, status_code=status.HTTP_403_FORBIDDEN)
+    return JSONResponse(content={
+        "databases": {
+            name: database.stats_snapshot()
+            for name, database in databases.items()
+        },
+        "routes": request_stats_snapshot()
+    }, status_code=status.HTTP_200_OK)
+
+
+@router.get("/cache")
+async def cache_stats(request: Request) -> JSONResponse:
+    """
+    返回各进程内缓存的大小与命中率
+    """
+    if request.session.get("identity") != "Administrator":
+        return JSONResponse(content={
+            "msg": "权限不足！"
+        }, status_code=status.HTTP_403_FORBIDDEN)
+    return JSONResponse(content={
+        name: cache.stats() for name, cache in caches.items()
+    }, status_code=status.HTTP_200_OK)
+
+
+@router.get("/ratelimit")
+async def ratelimit_stats(request: Request) -> JSONResponse:
+    """
+    返回各限流规则的放行与拒绝次数
+    """
+    if request.session.get("identity") != "Administrator":
+        return JSONResponse(content={
+            "msg": "权限不足！"
+        }, status_code=status.HTTP_403_FORBIDDEN)
+    return JSONResponse(content=rate_limiter.stats(), status_code=status.HTTP_200_OK)
+
+
+@router.get("/looplag")
+async def loop_lag(request: Request, events: int = 20) -> JSONResponse:
+    """
+    返回事件循环被阻塞的情况：按总阻塞时长排序的路由（附最长一次阻塞时的调用栈）与最近的阻塞记录
+
+    阻塞时没有在处理请求的记录为 <no request>，阻塞过短、检测线程没有来得及抓取调用栈的记录为 <unknown>
+    """
+    if request.session.get("identity") != "Administrator":
+        return JSONResponse(content={
+            "msg": "权限不足！"
+        }, status_code=status.HTTP_403_FORBIDDEN)
     return JSONResponse(
-        content={
-            "cpu_usage": cpu_usage,
-            "cpu_counts": cpu_cores,
-            "cpu_freq": cpu_freq,
-            "mem_total": memory_total,
-            "mem_usage": memory_usage
-        }, status_code=status.HTTP_200_OK
+        content=loop_lag_monitor.snapshot(max(0, events)),
+        status_code=status.HTTP_200_OK
+    )
+
+
+@router.get("/profiles")
+async def profiles(request: Request) -> JSONResponse:
+    """
+    返回已保存的请求分析结果列表
+
+    管理员在请求头中加入 X-Profile: 1（或查询参数 profile=1）即可分析该次请求
+    """
+    if request.session.get("identity") != "Administrator":
+        return JSONResponse(content={
+            "msg": "权限不足！"
+        }, status_code=status.HTTP_403_FORBIDDEN)
+    return JSONResponse(content={
+        "profiles": await asyncio.to_thread(list_profiles)
+    }, status_code=status.HTTP_200_OK)
+
+
+@router.get("/profiles/{profile_id}")
+async def profile_download(
+    profile_id: str,
+    request: Request,
+    format: str = "pstats",
+    sort: str = "cumulative",
+    limit: int = 50
+) -> Response:
+    """
+    下载请求分析结果
+
+    format:     pstats（默认，可以用 snakeviz 等工具打开）/ text（按 sort 排序的前 limit 个函数）
+    """
+    if request.session.get("identity") != "Administrator":
+        return JSONResponse(content={
+            "msg": "权限不足！"
+        }, status_code=status.HTTP_403_FORBIDDEN)
+    if (path := profile_path(profile_id)) is None or not os.path.exists(path):
+        return JSONResponse(content={
+            "msg": "分析结果不存在！"
+        }, status_code=status.HTTP_404_NOT_FOUND)
+    if format == "text":
+        try:
+            summary = await asyncio.to_thread(profile_summary, profile_id, sort, limit)
+        except KeyError:
+            return JSONResponse(content={
+                "msg": f"未知的排序方式: {sort}"
+            }, status_code=status.HTTP_400_BAD_REQUEST)
+        return PlainTextResponse(summary or "", status_code=status.HTTP_200_OK)
+    return FileResponse(
+        path=path,
+        filename=f"{profile_id}.prof",
+        media_type="application/octet-stream",
+        status_code=status.HTTP_200_OK
     )
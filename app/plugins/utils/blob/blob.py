@@ -0,0 +1,107 @@
+import os
+import uuid
+import hashlib
+import aiofiles
+
+from fastapi import UploadFile
+from typing import AsyncIterable, Optional
+
+
+#! 常见图片格式的文件头，用于推断 blob 的 media type
+_IMAGE_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+]
+
+
+class BlobStore:
+    """
+    本地磁盘上的内容寻址存储，每个 blob 以其内容的 sha256 命名，相同内容只保存一份
+
+    Args:
+        folder (str): 存储文件夹
+    """
+    def __init__(self, folder: str) -> None:
+        self.folder = folder
+        if not os.path.exists(folder):
+            os.makedirs(folder, exist_ok=True)
+
+    def path(self, digest: str) -> str:
+        """
+        返回 blob 在磁盘上的路径，使用前两位作为子文件夹，避免单个文件夹中文件过多
+        """
+        if len(digest) != 64 or any(c not in "0123456789abcdef" for c in digest):
+            raise ValueError(f"非法的 blob 标识: {digest}")
+        return os.path.join(self.folder, digest[:2], digest)
+
+    def exists(self, digest: str) -> bool:
+        return os.path.exists(self.path(digest))
+
+    async def save_stream(self, chunks: AsyncIterable[bytes]) -> str:
+        """
+        将数据流写入存储，边写边计算 sha256，返回 blob 标识
+
+        先写入临时文件，计算出 sha256 后再重命名，中途失败不会留下不完整的 blob
+        """
+        temp_path = os.path.join(self.folder, f".{uuid.uuid4().hex}.tmp")
+        sha256 = hashlib.sha256()
+        try:
+            async with aiofiles.open(temp_path, "wb") as file:
+                async for chunk in chunks:
+                    sha256.update(chunk)
+                    await file.write(chunk)
+            digest = sha256.hexdigest()
+            path = self.path(digest)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp_path, path)
+            return digest
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    async def save_bytes(self, data: bytes) -> str:
+        """
+        将一段数据写入存储，返回 blob 标识
+        """
+        async def single_chunk() -> AsyncIterable[bytes]:
+            yield data
+        return await self.save_stream(single_chunk())
+
+    async def read(self, digest: str) -> bytes:
+        async with aiofiles.open(self.path(digest), "rb") as file:
+            return await file.read()
+
+    def media_type(self, digest: str, default: str = "application/octet-stream") -> str:
+        """
+        根据文件头推断 blob 的 media type
+        """
+        with open(self.path(digest), "rb") as file:
+            head = file.read(16)
+        for signature, media_type in _IMAGE_SIGNATURES:
+            if head.startswith(signature):
+                return media_type
+        if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+            return "image/webp"
+        return default
+
+
+async def iter_upload(upload: UploadFile, chunk_size: int = 1024 * 1024) -> AsyncIterable[bytes]:
+    """
+    按块读取上传的文件，配合 BlobStore.save_stream 使用，避免把整个文件读入内存
+    """
+    while chunk := await upload.read(chunk_size):
+        yield chunk
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    判断请求头 If-None-Match 是否与 etag 匹配
+    """
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
@@ -0,0 +1,83 @@
+import time
+
+from collections import OrderedDict
+from typing import Any, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+
+V = TypeVar("V")
+
+# 缓存名: 缓存实例，用于统一查看各缓存的命中率，其他缓存实现 stats() 后也可以注册到这里
+caches: Dict[str, Any] = {}
+
+
+class TTLCache(Generic[V]):
+    """
+    进程内的 LRU 缓存，每一项在 ttl 秒后过期，超出 maxsize 时淘汰最久未使用的项
+
+    多 worker 部署时每个进程各有一份，其他进程的修改最多延迟 ttl 秒可见
+
+    Args:
+        name (str): 缓存名称，用于统计
+        maxsize (int): 最多缓存的项数
+        ttl (float): 有效期（秒）
+    """
+    def __init__(self, name: str, maxsize: int, ttl: float) -> None:
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.items: "OrderedDict[Hashable, Tuple[float, V]]" = OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        caches[name] = self
+
+    def get(self, key: Hashable) -> Optional[V]:
+        """
+        获取缓存项，不存在或已过期时返回 None
+        """
+        if (item := self.items.get(key)) is None:
+            self.misses += 1
+            return None
+        expires, value = item
+        if expires < time.monotonic():
+            del self.items[key]
+            self.misses += 1
+            return None
+        self.items.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def peek(self, key: Hashable) -> Optional[V]:
+        """
+        获取缓存项但不计入命中统计，也不更新使用顺序
+        """
+        if (item := self.items.get(key)) is None or item[0] < time.monotonic():
+            return None
+        return item[1]
+
+    def set(self, key: Hashable, value: V) -> None:
+        self.items[key] = (time.monotonic() + self.ttl, value)
+        self.items.move_to_end(key)
+        while len(self.items) > self.maxsize:
+            self.items.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable) -> Optional[V]:
+        if (item := self.items.pop(key, None)) is None:
+            return None
+        return item[1]
+
+    def clear(self) -> None:
+        self.items.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self.items),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0
+        }
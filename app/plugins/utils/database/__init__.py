@@ -1 +1,2 @@
 from .database import *
+from .stats import *
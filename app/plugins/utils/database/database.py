@@ -1,17 +1,94 @@
 import os
+import time
 
+from typing import Any, Dict, List, Optional
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
+from .stats import DatabaseStats, instrumented_pool, record_request_query, slow_query_threshold
+from ....manager import console
+
+
+#! SQLite 性能配置，每个新连接建立时都会执行其中的 PRAGMA
+DATABASE_PROFILES: Dict[str, Dict[str, Any]] = {
+    #? 不设置任何 PRAGMA，使用 SQLite 默认配置
+    "default": {},
+    #? 每次提交都落盘，WAL 允许读写并发，busy_timeout 避免 "database is locked"
+    "durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "busy_timeout": 5000,
+    },
+    #? 只在 checkpoint 时落盘，断电可能丢失最近的提交但不会损坏数据库，额外使用更大的缓存和内存映射
+    "throughput": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "cache_size": -65536,
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+    },
+}
+
+# 数据库名（文件名去掉扩展名）: Database 实例，用于统一查看各数据库的统计信息
+databases: Dict[str, "Database"] = {}
+
 
 class Database:
     """
     负责借助提供的 url 创建异步 SQLAlchemy 部件
+
+    Args:
+        head (str): 数据库 url 前缀，如 "sqlite+aiosqlite:///"
+        url (str): 数据库文件路径
+        profile (Optional[str]): DATABASE_PROFILES 中的配置名，默认读取环境变量 DATABASE_PROFILE，未设置时为 durable
+        pool_size (Optional[int]): 连接池大小，默认读取环境变量 DATABASE_POOL_SIZE，未设置时为 5，为 0 时不使用连接池
+        max_overflow (Optional[int]): 连接池允许的额外连接数，默认读取环境变量 DATABASE_MAX_OVERFLOW，未设置时为 10
+        slow_query_ms (Optional[float]): 慢查询阈值（毫秒），默认读取环境变量 DATABASE_SLOW_QUERY_MS，未设置时为 100
     """
-    def __init__(self, head: str, url: str) -> None:
+    def __init__(
+        self,
+        head: str,
+        url: str,
+        profile: Optional[str] = None,
+        pool_size: Optional[int] = None,
+        max_overflow: Optional[int] = None,
+        slow_query_ms: Optional[float] = None
+    ) -> None:
+        self.name = os.path.splitext(os.path.basename(url))[0]
+        self.stats = DatabaseStats(
+            self.name,
+            slow_query_ms / 1000 if slow_query_ms is not None else slow_query_threshold()
+        )
+        self.profile = profile or os.getenv("DATABASE_PROFILE") or "durable"
+        if self.profile not in DATABASE_PROFILES:
+            raise RuntimeError(
+                f"未知的数据库配置: {self.profile}! 可选项为 {' / '.join(DATABASE_PROFILES.keys())}"
+            )
+        self.pragmas: Dict[str, Any] = DATABASE_PROFILES[self.profile]
+        self.pool_size = pool_size if pool_size is not None else int(os.getenv("DATABASE_POOL_SIZE") or 5)
+        self.max_overflow = max_overflow if max_overflow is not None else int(os.getenv("DATABASE_MAX_OVERFLOW") or 10)
+
+        # aiosqlite 对文件数据库默认使用 NullPool，每个会话都要新建连接（和一个线程）并重新执行 PRAGMA
+        if self.pool_size > 0:
+            pool_args: Dict[str, Any] = {
+                "poolclass": instrumented_pool(AsyncAdaptedQueuePool, self.stats),
+                "pool_size": self.pool_size,
+                "max_overflow": self.max_overflow
+            }
+        else:
+            pool_args = {"poolclass": instrumented_pool(NullPool, self.stats)}
         self.engine = create_async_engine(
-            head + url, connect_args={"check_same_thread": False}
+            head + url,
+            connect_args={"check_same_thread": False},
+            **pool_args
         )
+        event.listen(self.engine.sync_engine, "connect", self.apply_pragmas)
+        event.listen(self.engine.sync_engine, "before_cursor_execute", self.before_cursor_execute)
+        event.listen(self.engine.sync_engine, "after_cursor_execute", self.after_cursor_execute)
         self.Session = async_sessionmaker(
             autocommit=False,
             autoflush=False,
@@ -21,3 +98,61 @@ class Database:
         if not os.path.exists(url):
             with open(url, "w"):
                 pass
+        console.log(
+            f'[green]使用[/green] 数据库配置 "[yellow]{self.profile}[/yellow]" '
+            f'([blue]{os.path.basename(url)}[/blue], pool_size={self.pool_size}, max_overflow={self.max_overflow}'
+            + "".join(f", {key}={value}" for key, value in self.pragmas.items()) + ")"
+        )
+        databases[self.name] = self
+
+    def apply_pragmas(self, dbapi_connection: Any, _: Any) -> None:
+        """
+        在新建立的连接上执行当前配置的 PRAGMA
+        """
+        if not self.pragmas:
+            return
+        cursor = dbapi_connection.cursor()
+        for key, value in self.pragmas.items():
+            cursor.execute(f"PRAGMA {key}={value}")
+        cursor.close()
+
+    def add_missing_columns(self, conn: Connection) -> List[str]:
+        """
+        create_all 不会为已经存在的表添加新的字段，这里用 ALTER TABLE 补上模型中新增的字段（只支持可空字段）
+
+        需要通过 AsyncConnection.run_sync 调用，返回添加的字段列表
+        """
+        inspector = inspect(conn)
+        added: List[str] = []
+        for table in self.Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=conn.dialect)
+                conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+                added.append(f"{table.name}.{column.name}")
+                console.log(f'[green]添加了[/green] 字段 "[yellow]{table.name}.{column.name}[/yellow]"')
+        return added
+
+    def before_cursor_execute(self, conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool) -> None:
+        # 开始时间保存在每条语句各自的执行上下文中，执行失败的语句不会在连接上留下记录
+        if context is not None:
+            context._query_start = time.perf_counter()
+
+    def after_cursor_execute(self, conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool) -> None:
+        if (start := getattr(context, "_query_start", None)) is None:
+            return
+        elapsed = time.perf_counter() - start
+        self.stats.record_query(statement, elapsed, record_request_query(elapsed))
+
+    def stats_snapshot(self) -> Dict[str, Any]:
+        """
+        返回连接池与查询的统计信息
+        """
+        return {
+            "profile": self.profile,
+            **self.stats.snapshot(self.engine.pool)
+        }
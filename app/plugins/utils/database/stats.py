@@ -0,0 +1,208 @@
+import os
+import re
+import time
+
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, List, Optional, Type
+from sqlalchemy.pool import Pool
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from ....manager import console
+
+
+#! 语句耗时直方图的桶上界（秒），最后一个桶为 +Inf
+LATENCY_BUCKETS: List[float] = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0]
+#! 最多分别统计多少种不同的语句，超出的部分合并到 "<other>"
+MAX_TRACKED_STATEMENTS: int = 256
+#! 慢查询日志保留条数
+SLOW_QUERY_LOG_SIZE: int = 100
+
+# 当前请求的 scope 与数据库用量：{"scope", "queries", "query_time"}，不在请求中时为 None
+_request_usage: ContextVar[Optional[Dict[str, Any]]] = ContextVar("request_usage", default=None)
+# 路由模板: 该路由的请求数、查询次数、查询耗时、请求耗时统计
+request_stats: Dict[str, Dict[str, float]] = {}
+
+
+def route_name(scope: Scope) -> str:
+    """
+    返回请求匹配到的路由模板，如 /auth/userdata/{which}，未匹配到路由时返回 <unmatched>
+    """
+    if (route := scope.get("route")) is not None and (path := getattr(route, "path", None)):
+        return path
+    return "<unmatched>"
+
+
+def _normalize(statement: str) -> str:
+    # 把 IN (?, ?, ...) 这类长度可变的参数列表折叠起来，避免同一条语句被统计成很多种
+    statement = re.sub(r"\s+", " ", statement).strip()
+    return re.sub(r"\((\s*\?\s*,)+\s*\?\s*\)", "(?, ...)", statement)[:500]
+
+
+class DatabaseStats:
+    """
+    记录一个数据库的连接池等待时间、语句耗时直方图和慢查询
+
+    Args:
+        name (str): 数据库名称
+        slow_query_threshold (float): 慢查询阈值（秒）
+    """
+    def __init__(self, name: str, slow_query_threshold: float) -> None:
+        self.name = name
+        self.slow_query_threshold = slow_query_threshold
+        self.reset()
+
+    def reset(self) -> None:
+        self.checkouts: int = 0
+        self.checkout_wait_total: float = 0.0
+        self.checkout_wait_max: float = 0.0
+        self.statements: Dict[str, Dict[str, Any]] = {}
+        self.slow_queries: Deque[Dict[str, Any]] = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+
+    def record_checkout(self, elapsed: float) -> None:
+        self.checkouts += 1
+        self.checkout_wait_total += elapsed
+        self.checkout_wait_max = max(self.checkout_wait_max, elapsed)
+
+    def record_query(self, statement: str, elapsed: float, route: Optional[str]) -> None:
+        key = _normalize(statement)
+        if key not in self.statements and len(self.statements) >= MAX_TRACKED_STATEMENTS:
+            key = "<other>"
+        if (stat := self.statements.get(key)) is None:
+            stat = self.statements[key] = {
+                "count": 0,
+                "total": 0.0,
+                "max": 0.0,
+                "buckets": [0] * (len(LATENCY_BUCKETS) + 1)
+            }
+        stat["count"] += 1
+        stat["total"] += elapsed
+        stat["max"] = max(stat["max"], elapsed)
+        index = 0
+        while index < len(LATENCY_BUCKETS) and elapsed > LATENCY_BUCKETS[index]:
+            index += 1
+        stat["buckets"][index] += 1
+
+        if elapsed >= self.slow_query_threshold:
+            self.slow_queries.append({
+                "statement": key,
+                "elapsed_ms": elapsed * 1000,
+                "route": route,
+                "time": time.time()
+            })
+            console.log(
+                f'[yellow]慢查询[/yellow] [blue]{self.name}[/blue] {elapsed * 1000:.1f}ms '
+                f'({route or "<no request>"}): {key[:200]}'
+            )
+
+    def snapshot(self, pool: Pool) -> Dict[str, Any]:
+        """
+        返回可以直接序列化为 json 的统计数据
+        """
+        return {
+            "pool": {
+                "status": pool.status(),
+                "checkouts": self.checkouts,
+                "checkout_wait_avg_ms": self.checkout_wait_total / self.checkouts * 1000 if self.checkouts else 0.0,
+                "checkout_wait_max_ms": self.checkout_wait_max * 1000,
+            },
+            "slow_query_threshold_ms": self.slow_query_threshold * 1000,
+            "statements": sorted([{
+                "statement": statement,
+                "count": stat["count"],
+                "avg_ms": stat["total"] / stat["count"] * 1000,
+                "max_ms": stat["max"] * 1000,
+                "total_ms": stat["total"] * 1000,
+                "histogram": {
+                    ("+Inf" if index == len(LATENCY_BUCKETS) else f"{LATENCY_BUCKETS[index] * 1000:g}ms"): count
+                    for index, count in enumerate(stat["buckets"])
+                }
+            } for statement, stat in self.statements.items()], key=lambda x: -x["total_ms"]),
+            "slow_queries": list(reversed(self.slow_queries)),
+        }
+
+
+def slow_query_threshold() -> float:
+    """
+    读取环境变量 DATABASE_SLOW_QUERY_MS 作为慢查询阈值（秒），默认 100ms
+    """
+    return float(os.getenv("DATABASE_SLOW_QUERY_MS") or 100) / 1000
+
+
+def instrumented_pool(base: Type[Pool], stats: DatabaseStats) -> Type[Pool]:
+    """
+    返回一个会记录获取连接等待时间的连接池类
+
+    连接池没有 "开始等待连接" 的事件，只能通过覆盖 _do_get 来计时；
+    用类属性保存 stats，连接池被 recreate 后依旧有效
+    """
+    class InstrumentedPool(base):  # type: ignore[valid-type, misc]
+        def _do_get(self) -> Any:
+            begin = time.perf_counter()
+            try:
+                return super()._do_get()
+            finally:
+                stats.record_checkout(time.perf_counter() - begin)
+
+    InstrumentedPool.__name__ = f"Instrumented{base.__name__}"
+    return InstrumentedPool
+
+
+def record_request_query(elapsed: float) -> Optional[str]:
+    """
+    将一次查询计入当前请求，返回当前请求的路由模板，不在请求中时返回 None
+    """
+    if (usage := _request_usage.get()) is None:
+        return None
+    usage["queries"] += 1
+    usage["query_time"] += elapsed
+    return route_name(usage["scope"])
+
+
+class QueryStatsMiddleware:
+    """
+    统计每个路由的请求数、每次请求的查询次数和查询耗时，用来区分慢在数据库还是慢在别处
+    """
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        usage: Dict[str, Any] = {"scope": scope, "queries": 0, "query_time": 0.0}
+        token = _request_usage.set(usage)
+        begin = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            elapsed = time.perf_counter() - begin
+            _request_usage.reset(token)
+            route = route_name(scope)
+            if (stat := request_stats.get(route)) is None:
+                stat = request_stats[route] = {
+                    "requests": 0,
+                    "queries": 0,
+                    "max_queries": 0,
+                    "query_time": 0.0,
+                    "request_time": 0.0
+                }
+            stat["requests"] += 1
+            stat["queries"] += usage["queries"]
+            stat["max_queries"] = max(stat["max_queries"], usage["queries"])
+            stat["query_time"] += usage["query_time"]
+            stat["request_time"] += elapsed
+
+
+def request_stats_snapshot() -> List[Dict[str, Any]]:
+    """
+    返回每个路由的平均查询次数、平均查询耗时与平均请求耗时
+    """
+    return sorted([{
+        "route": route,
+        "requests": stat["requests"],
+        "queries_per_request": stat["queries"] / stat["requests"],
+        "max_queries": stat["max_queries"],
+        "query_ms_per_request": stat["query_time"] / stat["requests"] * 1000,
+        "request_ms_per_request": stat["request_time"] / stat["requests"] * 1000,
+    } for route, stat in request_stats.items()], key=lambda x: -x["request_ms_per_request"] * x["requests"])
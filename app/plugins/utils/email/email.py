@@ -1,16 +1,421 @@
 import os
-import aiosmtplib
+import time
+import uuid
+import asyncio
 import datetime
 
+from collections import OrderedDict
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.utils import formataddr
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
 
+from ..metrics import Counter, Gauge
 from ....manager import console
 
+if TYPE_CHECKING:
+    import aiosmtplib
 
-async def send_mail(target: str, sender_name: str, title: str, msg: str) -> bool:
-    """异步发送纯文本邮件
+
+class EmailConfig:
+    #! 同时保持的 SMTP 连接数，也是后台发送的并发数，可以用环境变量 EMAIL_POOL_SIZE 覆盖
+    POOL_SIZE: int = 4
+    #! 连接空闲超过该时间（秒）后不再复用，SMTP 服务器通常也会主动断开空闲连接
+    IDLE_TIMEOUT: float = 60.0
+    #! 发送失败后的重试次数，以及第一次重试前的等待时间（秒），之后每次翻倍
+    MAX_RETRIES: int = 3
+    RETRY_BACKOFF: float = 2.0
+    #! 保留的发送记录条数
+    HISTORY_SIZE: int = 1000
+    #! 批量发送的默认并发数与上限，每个批次使用独立的连接池，不会阻塞验证码等单封邮件
+    BATCH_PARALLELISM: int = 8
+    BATCH_MAX_PARALLELISM: int = 32
+    #! 保留的批量发送记录个数
+    BATCH_HISTORY_SIZE: int = 20
+
+
+def smtp_settings() -> Optional[Dict[str, Any]]:
+    """读取 SMTP 配置
+
+    环境变量：
+        EMAIL: 发件人地址
+        EMAIL_HOST: SMTP 服务器地址
+        EMAIL_PORT: SMTP 服务器端口，可选
+        EMAIL_PASSKEY: SMTP 授权码，为空时不登录（例如本地调试用的 SMTP 服务器）
+        EMAIL_USE_TLS: 是否在连接时直接使用 TLS（1 / 0），可选，默认只在端口为 465 时使用；
+            其他端口在服务器支持时通过 STARTTLS 升级
+
+    Returns:
+        Optional[Dict[str, Any]]: 未配置 EMAIL 或 EMAIL_HOST 时返回 None
+    """
+    email = os.getenv("EMAIL")
+    email_host = os.getenv("EMAIL_HOST")
+    if email is None or email_host is None:
+        console.log("[red][on #F8BBD0]未配置邮箱信息，请检查环境(EMAIL, EMAIL_PASSKEY, EMAIL_HOST)变量是否设置！[/on #F8BBD0][/red]")
+        return None
+    port = int(os.getenv("EMAIL_PORT") or 0) or None
+    use_tls = os.getenv("EMAIL_USE_TLS")
+    return {
+        "email": email,
+        "passkey": os.getenv("EMAIL_PASSKEY") or None,
+        "host": email_host,
+        "port": port,
+        "use_tls": use_tls == "1" if use_tls else port == 465
+    }
+
+
+def build_message(sender: str, target: str, sender_name: str, title: str, msg: str) -> MIMEMultipart:
+    """
+    构造纯文本邮件，标题后会附加当前时间
+    """
+    message = MIMEMultipart()
+    time_info = datetime.datetime.today().strftime("%m-%d %H: %M")
+    message["From"] = formataddr(pair=(sender_name, sender))
+    message["To"] = target
+    message["Subject"] = title + " -- {}".format(time_info)
+    message.attach(MIMEText(msg, "plain", "utf-8"))
+    return message
+
+
+class SMTPPool:
+    """
+    已登录的 SMTP 连接池，发送完成的连接会被放回池中复用，避免每封邮件都重新握手和登录
+
+    Args:
+        size (int): 最多同时保持的连接数
+    """
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.semaphore = asyncio.Semaphore(size)
+        # (上次使用时间, 连接)
+        self.idle: List[Tuple[float, "aiosmtplib.SMTP"]] = []
+        self.connects: int = 0
+
+    async def connect(self, settings: Dict[str, Any]) -> "aiosmtplib.SMTP":
+        import aiosmtplib
+
+        conn = aiosmtplib.SMTP(hostname=settings["host"], port=settings["port"], use_tls=settings["use_tls"])
+        await conn.connect()
+        if settings["passkey"] is not None:
+            await conn.login(settings["email"], settings["passkey"])
+        self.connects += 1
+        return conn
+
+    async def discard(self, conn: "aiosmtplib.SMTP") -> None:
+        try:
+            if conn.is_connected:
+                await conn.quit()
+        except Exception:
+            conn.close()
+
+    async def acquire(self, settings: Dict[str, Any]) -> Tuple["aiosmtplib.SMTP", bool]:
+        """
+        获取一个连接，返回 (连接, 是否为复用的连接)
+        """
+        await self.semaphore.acquire()
+        try:
+            while self.idle:
+                last_used, conn = self.idle.pop()
+                if conn.is_connected and time.monotonic() - last_used < EmailConfig.IDLE_TIMEOUT:
+                    return conn, True
+                await self.discard(conn)
+            return await self.connect(settings), False
+        except BaseException:
+            self.semaphore.release()
+            raise
+
+    async def release(self, conn: "aiosmtplib.SMTP", broken: bool = False) -> None:
+        try:
+            if broken:
+                # 连接可能停在 DATA 等中间状态，发送 QUIT 可能永远得不到回复，直接断开
+                conn.close()
+            elif not conn.is_connected:
+                await self.discard(conn)
+            else:
+                self.idle.append((time.monotonic(), conn))
+        finally:
+            self.semaphore.release()
+
+    async def send(self, settings: Dict[str, Any], target: str, message: MIMEMultipart) -> None:
+        """
+        使用池中的连接发送邮件，复用的连接已被服务器断开时自动换用新连接再试一次
+        """
+        import aiosmtplib
+
+        while True:
+            conn, reused = await self.acquire(settings)
+            try:
+                await conn.sendmail(settings["email"], target, message.as_string())
+            except (aiosmtplib.SMTPServerDisconnected, ConnectionError):
+                await self.release(conn, broken=True)
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                await self.release(conn, broken=True)
+                raise
+            await self.release(conn)
+            return
+
+    async def close(self) -> None:
+        while self.idle:
+            _, conn = self.idle.pop()
+            await self.discard(conn)
+        # 信号量会绑定到第一次使用它的事件循环上，关闭后重新创建
+        self.semaphore = asyncio.Semaphore(self.size)
+
+
+class MailQueue:
+    """
+    进程内的邮件发送队列，由固定数量的后台 worker 通过 SMTPPool 发送，失败时按指数退避重试
+
+    Args:
+        pool (SMTPPool): SMTP 连接池，worker 数量与连接池大小一致
+        history_size (int): 保留的发送记录条数
+    """
+    def __init__(self, pool: SMTPPool, history_size: int = EmailConfig.HISTORY_SIZE) -> None:
+        self.pool = pool
+        self.history_size = history_size
+        self.queue: Optional[asyncio.Queue] = None
+        self.workers: List[asyncio.Task] = []
+        # 邮件 id: 发送状态，不包含邮件正文（正文中可能有密码）
+        self.jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.counters: Dict[str, int] = {"queued": 0, "sent": 0, "failed": 0, "retries": 0}
+
+    def start(self) -> None:
+        """
+        在当前事件循环中启动后台 worker，已经启动时什么都不做
+        """
+        if self.workers:
+            return
+        self.queue = asyncio.Queue()
+        self.workers = [asyncio.create_task(self.worker()) for _ in range(self.pool.size)]
+
+    async def stop(self) -> None:
+        """
+        停止后台 worker 并关闭所有连接，尚未发送的邮件会被标记为失败
+        """
+        workers, self.workers = self.workers, []
+        while workers:
+            for worker in workers:
+                worker.cancel()
+            # aiosmtplib 内部使用的 asyncio.wait_for 在 Python 3.11 中可能吞掉取消，需要重复取消直到 worker 退出
+            _, pending = await asyncio.wait(workers, timeout=1.0)
+            workers = list(pending)
+        if self.queue is not None:
+            while not self.queue.empty():
+                job, _ = self.queue.get_nowait()
+                job.update(status="failed", error="服务器关闭时尚未发送")
+        self.queue = None
+        await self.pool.close()
+
+    def enqueue(
+        self,
+        target: str,
+        sender_name: str,
+        title: str,
+        msg: str,
+        meta: Optional[Dict[str, Any]] = None
+    ) -> Optional[str]:
+        """将邮件加入发送队列，立即返回
+
+        Args:
+            target (str): 目标邮箱地址
+            sender_name (str): 发送者名称
+            title (str): 邮件标题
+            msg (str): 邮件正文
+            meta (Optional[Dict[str, Any]]): 附加到发送记录中的信息，如用户名
+
+        Returns:
+            Optional[str]: 邮件 id，可以用 status 查询发送状态；未配置邮箱时返回 None
+        """
+        if (settings := smtp_settings()) is None:
+            return None
+        self.start()
+        job_id = uuid.uuid4().hex
+        job: Dict[str, Any] = {
+            **(meta or {}),
+            "id": job_id,
+            "target": target,
+            "title": title,
+            "status": "queued",
+            "attempts": 0,
+            "error": None,
+            "created": time.time(),
+            "finished": None
+        }
+        self.jobs[job_id] = job
+        while len(self.jobs) > self.history_size:
+            self.jobs.popitem(last=False)
+        self.counters["queued"] += 1
+        assert self.queue is not None
+        self.queue.put_nowait((job, (settings, build_message(settings["email"], target, sender_name, title, msg))))
+        return job_id
+
+    async def worker(self) -> None:
+        assert self.queue is not None
+        queue = self.queue
+        while True:
+            job, (settings, message) = await queue.get()
+            try:
+                await self.deliver(job, settings, message)
+            except Exception:
+                console.print_exception(show_locals=True)
+            finally:
+                queue.task_done()
+
+    async def deliver(self, job: Dict[str, Any], settings: Dict[str, Any], message: MIMEMultipart) -> None:
+        for attempt in range(EmailConfig.MAX_RETRIES + 1):
+            job["status"] = "sending"
+            job["attempts"] = attempt + 1
+            try:
+                await self.pool.send(settings, job["target"], message)
+                job.update(status="sent", error=None, finished=time.time())
+                self.counters["sent"] += 1
+                return
+            except Exception as e:
+                job["error"] = repr(e)
+                if attempt == EmailConfig.MAX_RETRIES:
+                    break
+                job["status"] = "retrying"
+                self.counters["retries"] += 1
+                await asyncio.sleep(EmailConfig.RETRY_BACKOFF * 2 ** attempt)
+        job.update(status="failed", finished=time.time())
+        self.counters["failed"] += 1
+        console.log(f'[red]邮件发送失败[/red] [yellow]{job["target"]}[/yellow]: {job["error"]}')
+
+    async def join(self) -> None:
+        """
+        等待队列中的所有邮件处理完毕
+        """
+        if self.queue is not None:
+            await self.queue.join()
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        if (job := self.jobs.get(job_id)) is None:
+            return None
+        return dict(job)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "pending": self.queue.qsize() if self.queue is not None else 0,
+            "workers": len(self.workers),
+            "idle_connections": len(self.pool.idle),
+            "connects": self.pool.connects
+        }
+
+
+class MailBatch:
+    """
+    一批并发发送的邮件，使用独立的 MailQueue 与连接池，全部处理完毕后自动关闭连接
+
+    Args:
+        parallelism (int): 并发数，即同时保持的 SMTP 连接数
+        size (int): 邮件总数
+    """
+    def __init__(self, parallelism: int, size: int) -> None:
+        self.id = uuid.uuid4().hex
+        self.parallelism = parallelism
+        self.queue = MailQueue(SMTPPool(parallelism), history_size=max(size, 1))
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """
+        所有邮件加入队列之后调用，在后台等待发送完毕
+        """
+        self.task = asyncio.create_task(self.run())
+
+    async def run(self) -> None:
+        try:
+            await self.queue.join()
+        finally:
+            await self.queue.stop()
+            self.finished = time.time()
+            console.log(
+                f'[green]批量邮件发送完成[/green] [blue]{self.id}[/blue] '
+                f'成功 {self.queue.counters["sent"]} 封，失败 {self.queue.counters["failed"]} 封，'
+                f'用时 {self.finished - self.created:.1f}s'
+            )
+
+    def progress(self) -> Dict[str, Any]:
+        """
+        返回发送进度，不包含每封邮件的结果
+        """
+        counts = {"queued": 0, "sending": 0, "retrying": 0, "sent": 0, "failed": 0}
+        for job in self.queue.jobs.values():
+            counts[job["status"]] += 1
+        return {
+            "id": self.id,
+            "total": len(self.queue.jobs),
+            **counts,
+            "parallelism": self.parallelism,
+            "connects": self.queue.pool.connects,
+            "created": self.created,
+            "finished": self.finished
+        }
+
+    def results(self) -> List[Dict[str, Any]]:
+        """
+        返回每封邮件的发送结果
+        """
+        return [dict(job) for job in self.queue.jobs.values()]
+
+
+mail_queue: MailQueue = MailQueue(SMTPPool(int(os.getenv("EMAIL_POOL_SIZE") or EmailConfig.POOL_SIZE)))
+# 批量发送 id: MailBatch，按创建顺序排列
+mail_batches: "OrderedDict[str, MailBatch]" = OrderedDict()
+# 已淘汰批次的计数之和，保证 mail_messages_total 不会因为淘汰而减少
+evicted_batch_counters: Dict[str, int] = {"queued": 0, "sent": 0, "failed": 0, "retries": 0}
+
+
+def start_mail_batch(mails: List[Dict[str, Any]], sender_name: str, parallelism: Optional[int] = None) -> Optional[MailBatch]:
+    """并发发送一批纯文本邮件，立即返回，可以通过 mail_batches 查询进度
+
+    Args:
+        mails (List[Dict[str, Any]]): 每封邮件包含 target、title、msg，其余字段会作为附加信息保存在发送记录中
+        sender_name (str): 发送者名称
+        parallelism (Optional[int]): 并发数，默认为 EmailConfig.BATCH_PARALLELISM，最大为 EmailConfig.BATCH_MAX_PARALLELISM
+
+    Returns:
+        Optional[MailBatch]: 批量发送任务，未配置邮箱时返回 None
+    """
+    if smtp_settings() is None:
+        return None
+    parallelism = min(max(parallelism or EmailConfig.BATCH_PARALLELISM, 1), EmailConfig.BATCH_MAX_PARALLELISM)
+    batch = MailBatch(parallelism, len(mails))
+    for mail in mails:
+        mail = dict(mail)
+        batch.queue.enqueue(mail.pop("target"), sender_name, mail.pop("title"), mail.pop("msg"), meta=mail)
+    batch.start()
+    mail_batches[batch.id] = batch
+    # 只淘汰已经完成的批次
+    for batch_id in list(mail_batches.keys()):
+        if len(mail_batches) <= EmailConfig.BATCH_HISTORY_SIZE:
+            break
+        if mail_batches[batch_id].finished is not None:
+            for key, value in mail_batches.pop(batch_id).queue.counters.items():
+                evicted_batch_counters[key] += value
+    return batch
+
+
+async def close_mail() -> None:
+    """
+    停止后台邮件队列与所有未完成的批量发送，在应用关闭时调用
+    """
+    for batch in mail_batches.values():
+        if batch.task is not None and not batch.task.done():
+            batch.task.cancel()
+    await asyncio.gather(*(
+        batch.task for batch in mail_batches.values() if batch.task is not None
+    ), return_exceptions=True)
+    await mail_queue.stop()
+
+
+def enqueue_mail(target: str, sender_name: str, title: str, msg: str) -> Optional[str]:
+    """将纯文本邮件加入后台发送队列，立即返回
 
     Args:
         target (str): 目标邮箱地址
@@ -19,30 +424,30 @@ async def send_mail(target: str, sender_name: str, title: str, msg: str) -> bool
         msg (str): 邮件正文
 
     Returns:
-        bool: 发送邮件是否成功，成功为 True，否则为 False
+        Optional[str]: 邮件 id，未配置邮箱时返回 None
     """
-    message = MIMEMultipart()
-    time = datetime.datetime.today().strftime("%m-%d %H: %M")
-    email = os.getenv("EMAIL")
-    email_passkey = os.getenv("EMAIL_PASSKEY")
-    email_host = os.getenv("EMAIL_HOST")
-    if email is None or \
-       email_passkey is None or \
-       email_host is None:
-        console.log("[red][on #F8BBD0]未配置邮箱信息，请检查环境(EMAIL, EMAIL_PASSKEY, EMAIL_HOST)变量是否设置！[/on #F8BBD0][/red]")
-        return False
+    return mail_queue.enqueue(target, sender_name, title, msg)
 
-    message["From"] = formataddr(pair=(sender_name, email))
-    message["To"] = target
-    message["Subject"] = title + " -- {}".format(time)
 
-    message.attach(MIMEText(msg, "plain", "utf-8"))
+def _mail_counters() -> Dict[Tuple[str, ...], float]:
+    totals: Dict[str, int] = dict(mail_queue.counters)
+    for key, value in evicted_batch_counters.items():
+        totals[key] += value
+    for batch in mail_batches.values():
+        for key, value in batch.queue.counters.items():
+            totals[key] += value
+    return {(key,): float(value) for key, value in totals.items()}
+
+
+def _mail_pending() -> Dict[Tuple[str, ...], float]:
+    pending = mail_queue.stats()["pending"] + sum(
+        batch.queue.stats()["pending"] for batch in mail_batches.values()
+    )
+    return {(): float(pending)}
+
 
-    try:
-        async with aiosmtplib.SMTP(hostname=email_host) as server:
-            await server.login(email, email_passkey)
-            await server.sendmail(email, target, message.as_string())
-        return True
-    except Exception:
-        console.print_exception(show_locals=True)
-        return False
+Counter(
+    "mail_messages_total", "邮件数量，status 为 queued（入队）/ sent / failed / retries（重试次数）",
+    ("status",), collect=_mail_counters
+)
+Gauge("mail_queue_pending", "等待发送的邮件数", collect=_mail_pending)
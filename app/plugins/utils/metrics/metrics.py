@@ -0,0 +1,192 @@
+import os
+import time
+
+from typing import Callable, Dict, List, Optional, Tuple
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ..database.stats import route_name
+
+
+#! 请求耗时直方图的桶上界（秒），最后一个桶为 +Inf
+REQUEST_LATENCY_BUCKETS: List[float] = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+# 指标名: 指标实例，按注册顺序输出
+metrics: Dict[str, "Metric"] = {}
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    # 指标只统计当前进程，多 worker 部署时用 pid 区分来自不同 worker 的样本
+    names = ("pid",) + names
+    values = (str(os.getpid()),) + values
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """
+    Prometheus 指标基类，每组标签值对应一个样本
+
+    Args:
+        name (str): 指标名
+        documentation (str): 说明，输出在 # HELP 中
+        labels (Tuple[str, ...]): 标签名
+        collect (Optional[Callable[[], Dict[Tuple[str, ...], float]]]): 提供时在输出前调用，用返回值作为全部样本，
+            适用于其他模块已经在统计的数值
+    """
+    type: str = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Tuple[str, ...] = (),
+        collect: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = labels
+        self.collect = collect
+        self.values: Dict[Tuple[str, ...], float] = {}
+        metrics[name] = self
+
+    def samples(self) -> List[str]:
+        values = self.collect() if self.collect is not None else self.values
+        return [
+            f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+            for labels, value in values.items()
+        ]
+
+    def render(self) -> str:
+        return "\n".join([
+            f"# HELP {self.name} {_escape(self.documentation)}",
+            f"# TYPE {self.name} {self.type}",
+            *self.samples()
+        ])
+
+
+class Counter(Metric):
+    """
+    只增不减的计数器
+    """
+    type = "counter"
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+
+class Gauge(Metric):
+    """
+    可增可减的数值
+    """
+    type = "gauge"
+
+    def set(self, value: float, *labels: str) -> None:
+        self.values[labels] = value
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.values[labels] = self.values.get(labels, 0.0) - amount
+
+
+class Histogram(Metric):
+    """
+    直方图，输出累积的 _bucket、_sum 与 _count
+
+    Args:
+        buckets (List[float]): 桶上界，会自动补上 +Inf
+    """
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (), buckets: List[float] = REQUEST_LATENCY_BUCKETS) -> None:
+        super().__init__(name, documentation, labels)
+        self.buckets = sorted(buckets) + [float("inf")]
+        # 标签值: (各桶计数（非累积）, 总和)
+        self.observations: Dict[Tuple[str, ...], Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        if (item := self.observations.get(labels)) is None:
+            item = self.observations[labels] = ([0] * len(self.buckets), 0.0)
+        counts, total = item
+        index = 0
+        while value > self.buckets[index]:
+            index += 1
+        counts[index] += 1
+        self.observations[labels] = (counts, total + value)
+
+    def samples(self) -> List[str]:
+        lines: List[str] = []
+        for labels, (counts, total) in self.observations.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(
+                    f"{self.name}_bucket"
+                    f"{_format_labels(self.label_names + ('le',), labels + (_format_value(bound),))} {cumulative}"
+                )
+            label_str = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_str} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_str} {cumulative}")
+        return lines
+
+
+def render_metrics() -> str:
+    """
+    以 Prometheus 文本格式输出所有已注册的指标
+    """
+    return "\n".join(metric.render() for metric in metrics.values()) + "\n"
+
+
+http_requests_total: Counter = Counter(
+    "http_requests_total", "按路由模板与状态码统计的请求数", ("method", "route", "status")
+)
+http_requests_in_progress: Gauge = Gauge(
+    "http_requests_in_progress", "正在处理的请求数", ("method",)
+)
+http_request_duration_seconds: Histogram = Histogram(
+    "http_request_duration_seconds", "按路由模板统计的请求耗时（秒）", ("method", "route")
+)
+
+
+class MetricsMiddleware:
+    """
+    记录每个路由模板的请求数、状态码、耗时直方图以及正在处理的请求数
+
+    路由模板在路由匹配后才能知道，所以正在处理的请求数只按请求方法区分
+    """
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        status_code = 500
+        http_requests_in_progress.inc(method)
+        begin = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - begin
+            http_requests_in_progress.dec(method)
+            route = route_name(scope)
+            http_requests_total.inc(method, route, str(status_code))
+            http_request_duration_seconds.observe(elapsed, method, route)
@@ -0,0 +1,2 @@
+from .profiling import *
+from .looplag import *
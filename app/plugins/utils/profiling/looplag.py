@@ -0,0 +1,174 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+import traceback
+
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from ..database.stats import route_name
+from ..metrics import Counter
+from ....manager import console
+
+
+class LoopLagConfig:
+    #! 是否启用事件循环阻塞检测，可以用环境变量 LOOP_LAG_MONITOR=0 关闭
+    ENABLED: bool = os.getenv("LOOP_LAG_MONITOR") != "0"
+    #! 检测间隔（秒）
+    INTERVAL: float = 0.05
+    #! 事件循环被阻塞超过该时间（秒）时记录，可以用环境变量 LOOP_LAG_THRESHOLD_MS 覆盖
+    THRESHOLD: float = float(os.getenv("LOOP_LAG_THRESHOLD_MS") or 100) / 1000
+    #! 保留的阻塞记录条数，以及每条记录保留的调用栈层数
+    LOG_SIZE: int = 100
+    STACK_DEPTH: int = 30
+
+
+class LoopLagMonitor:
+    """
+    检测事件循环被同步代码阻塞的情况
+
+    事件循环中的任务每隔 interval 秒更新一次心跳，并用实际的唤醒延迟计算阻塞时长；
+    另一个线程在心跳超时的时候抓取事件循环线程当前的调用栈，并找出正在执行的请求所属的路由，
+    所以记录中的调用栈就是阻塞发生时正在执行的代码
+
+    Args:
+        interval (float): 检测间隔（秒）
+        threshold (float): 记录阈值（秒）
+    """
+    def __init__(self, interval: float, threshold: float) -> None:
+        self.interval = interval
+        self.threshold = threshold
+        # 正在处理请求的任务: 请求 scope，由 LoopLagMiddleware 维护
+        self.active: Dict["asyncio.Task[Any]", Scope] = {}
+        self.events: Deque[Dict[str, Any]] = deque(maxlen=LoopLagConfig.LOG_SIZE)
+        # 路由模板: 阻塞次数、总时长、最长时长与最近一次的调用栈
+        self.routes: Dict[str, Dict[str, Any]] = {}
+        self.max_lag: float = 0.0
+        self.heartbeat: float = time.monotonic()
+        # 检测线程抓取到的、尚未结束的阻塞：(路由, 调用栈)
+        self.pending: Optional[Tuple[str, List[str]]] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.loop_thread_id: Optional[int] = None
+        self.task: Optional["asyncio.Task[None]"] = None
+        self.stopped = threading.Event()
+
+    def start(self) -> None:
+        if self.task is not None:
+            return
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread_id = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        self.stopped.clear()
+        self.task = asyncio.create_task(self.tick())
+        threading.Thread(target=self.watch, name="loop-lag-watchdog", daemon=True).start()
+
+    async def stop(self) -> None:
+        self.stopped.set()
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def tick(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.heartbeat = now
+            lag = max(now - expected, 0.0)
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= self.threshold:
+                self.record(lag)
+            else:
+                self.pending = None
+
+    def watch(self) -> None:
+        while not self.stopped.wait(min(self.threshold, self.interval) / 2):
+            if self.pending is None and time.monotonic() - self.heartbeat > self.interval + self.threshold:
+                self.pending = self.capture()
+
+    def capture(self) -> Tuple[str, List[str]]:
+        """
+        在检测线程中抓取事件循环线程的调用栈与正在执行的请求路由
+        """
+        route = "<no request>"
+        assert self.loop is not None
+        try:
+            if (task := asyncio.current_task(self.loop)) is not None and (scope := self.active.get(task)) is not None:
+                route = route_name(scope)
+        except RuntimeError:
+            pass
+        stack: List[str] = []
+        if (frame := sys._current_frames().get(self.loop_thread_id or 0)) is not None:
+            stack = traceback.format_stack(frame)[-LoopLagConfig.STACK_DEPTH:]
+        return route, stack
+
+    def record(self, lag: float) -> None:
+        route, stack = self.pending or ("<unknown>", [])
+        self.pending = None
+        self.events.append({
+            "time": time.time(),
+            "lag_ms": lag * 1000,
+            "route": route,
+            "stack": stack
+        })
+        if (stat := self.routes.get(route)) is None:
+            stat = self.routes[route] = {"count": 0, "total": 0.0, "max": 0.0, "stack": []}
+        stat["count"] += 1
+        stat["total"] += lag
+        if lag >= stat["max"]:
+            stat["max"] = lag
+            stat["stack"] = stack
+        location = stack[-1].strip().splitlines()[0] if stack else "无调用栈"
+        console.log(f'[yellow]事件循环阻塞[/yellow] {lag * 1000:.1f}ms ({route}): {location}')
+
+    def snapshot(self, events: int = 20) -> Dict[str, Any]:
+        """
+        返回阻塞最严重的路由（按总阻塞时长排序）与最近的阻塞记录
+        """
+        return {
+            "enabled": self.task is not None,
+            "threshold_ms": self.threshold * 1000,
+            "max_lag_ms": self.max_lag * 1000,
+            "routes": sorted([{
+                "route": route,
+                "count": stat["count"],
+                "total_ms": stat["total"] * 1000,
+                "max_ms": stat["max"] * 1000,
+                "worst_stack": stat["stack"]
+            } for route, stat in self.routes.items()], key=lambda x: -x["total_ms"]),
+            "events": list(reversed(self.events))[:events]
+        }
+
+
+loop_lag_monitor: LoopLagMonitor = LoopLagMonitor(LoopLagConfig.INTERVAL, LoopLagConfig.THRESHOLD)
+
+Counter(
+    "event_loop_stalls_total", "事件循环被阻塞超过阈值的次数，route 为阻塞时正在执行的请求路由",
+    ("route",), collect=lambda: {(route,): float(stat["count"]) for route, stat in loop_lag_monitor.routes.items()}
+)
+Counter(
+    "event_loop_stall_seconds_total", "事件循环被阻塞超过阈值的总时长（秒）",
+    ("route",), collect=lambda: {(route,): stat["total"] for route, stat in loop_lag_monitor.routes.items()}
+)
+
+
+class LoopLagMiddleware:
+    """
+    记录每个任务正在处理的请求，用于把事件循环阻塞归因到路由
+    """
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or (task := asyncio.current_task()) is None:
+            await self.app(scope, receive, send)
+            return
+        loop_lag_monitor.active[task] = scope
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            loop_lag_monitor.active.pop(task, None)
@@ -0,0 +1,170 @@
+import io
+import os
+import re
+import time
+import uuid
+import asyncio
+import pstats
+import cProfile
+
+from typing import Any, Dict, List, Optional
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ..database.stats import route_name
+from ....manager import console
+
+
+class ProfilingConfig:
+    #! 开启分析的请求头与查询参数，值为 1 时生效，只对管理员 session 有效
+    HEADER: str = "x-profile"
+    QUERY: str = "profile"
+    #! 分析结果的保存位置，可以用环境变量 PROFILE_FOLDER 覆盖
+    FOLDER: str = os.getenv("PROFILE_FOLDER") or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        ".profiles/"
+    )
+    #! 最多保留的分析结果个数，超出时删除最旧的
+    MAX_PROFILES: int = 20
+
+
+_profile_id_pattern = re.compile(r"^[0-9a-f]{32}$")
+
+
+def profile_path(profile_id: str) -> Optional[str]:
+    """
+    返回分析结果文件的路径，id 不合法时返回 None
+    """
+    if not _profile_id_pattern.match(profile_id):
+        return None
+    return os.path.join(ProfilingConfig.FOLDER, f"{profile_id}.prof")
+
+
+def _wants_profile(scope: Scope) -> bool:
+    for key, value in scope["headers"]:
+        if key == ProfilingConfig.HEADER.encode("latin-1"):
+            return value == b"1"
+    query: bytes = scope.get("query_string", b"")
+    return f"{ProfilingConfig.QUERY}=1".encode("latin-1") in query.split(b"&")
+
+
+class ProfilingMiddleware:
+    """
+    管理员在请求头中加入 X-Profile: 1（或查询参数 profile=1）时，用 cProfile 分析这一次请求
+
+    结果以 pstats 格式保存，响应头 X-Profile-Id 为结果的 id，可以通过 /sysinfo/profiles 下载；
+    没有开启分析的请求只多一次请求头查找
+
+    cProfile 记录的是整个事件循环线程，分析期间同时处理的其他请求也会被计入，线程池中的工作不会被计入；
+    同一时间只分析一个请求，其他请求的响应头 X-Profile-Id 为 busy
+
+    需要放在 session 中间件内侧
+    """
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self.active = False
+        os.makedirs(ProfilingConfig.FOLDER, exist_ok=True)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not _wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+        if scope.get("session", {}).get("identity") != "Administrator":
+            await self.app(scope, receive, send)
+            return
+        if self.active:
+            await self.app(scope, receive, self.with_header(send, "busy"))
+            return
+
+        profile_id = uuid.uuid4().hex
+        profiler = cProfile.Profile()
+        self.active = True
+        begin = time.perf_counter()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, self.with_header(send, profile_id))
+        finally:
+            profiler.disable()
+            elapsed = time.perf_counter() - begin
+            self.active = False
+            # 写文件与清理旧结果都会访问磁盘，放到线程中执行，不阻塞事件循环
+            await asyncio.to_thread(self.save, profile_id, profiler, scope, elapsed)
+
+    def with_header(self, send: Send, value: str) -> Send:
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append("X-Profile-Id", value)
+            await send(message)
+        return send_wrapper
+
+    def save(self, profile_id: str, profiler: cProfile.Profile, scope: Scope, elapsed: float) -> None:
+        path = profile_path(profile_id)
+        assert path is not None
+        try:
+            os.makedirs(ProfilingConfig.FOLDER, exist_ok=True)
+            profiler.dump_stats(path)
+            console.log(
+                f'[green]已保存[/green] 请求分析 [yellow]{scope["method"]} {route_name(scope)}[/yellow] '
+                f'{elapsed * 1000:.1f}ms: [blue]{profile_id}[/blue]'
+            )
+            with open(os.path.join(ProfilingConfig.FOLDER, f"{profile_id}.txt"), "w", encoding="utf-8") as file:
+                file.write(f'{scope["method"]} {scope["path"]}\n{route_name(scope)}\n{elapsed}\n')
+            prune_profiles()
+        except Exception:
+            console.print_exception(show_locals=True)
+
+
+def list_profiles() -> List[Dict[str, Any]]:
+    """
+    返回已保存的分析结果，按时间从新到旧排列
+    """
+    if not os.path.exists(ProfilingConfig.FOLDER):
+        return []
+    profiles: List[Dict[str, Any]] = []
+    for entry in os.scandir(ProfilingConfig.FOLDER):
+        if not entry.name.endswith(".prof"):
+            continue
+        profile_id = entry.name[:-len(".prof")]
+        info: Dict[str, Any] = {
+            "id": profile_id,
+            "time": entry.stat().st_mtime,
+            "size": entry.stat().st_size,
+            "request": None,
+            "route": None,
+            "elapsed_ms": None
+        }
+        try:
+            with open(os.path.join(ProfilingConfig.FOLDER, f"{profile_id}.txt"), "r", encoding="utf-8") as file:
+                request, route, elapsed = file.read().splitlines()[:3]
+            info.update(request=request, route=route, elapsed_ms=float(elapsed) * 1000)
+        except (OSError, ValueError):
+            pass
+        profiles.append(info)
+    return sorted(profiles, key=lambda x: -x["time"])
+
+
+def prune_profiles() -> None:
+    """
+    只保留最新的 ProfilingConfig.MAX_PROFILES 个分析结果
+    """
+    for info in list_profiles()[ProfilingConfig.MAX_PROFILES:]:
+        for extension in (".prof", ".txt"):
+            try:
+                os.remove(os.path.join(ProfilingConfig.FOLDER, info["id"] + extension))
+            except FileNotFoundError:
+                pass
+
+
+def profile_summary(profile_id: str, sort: str = "cumulative", limit: int = 50) -> Optional[str]:
+    """
+    返回分析结果的文本摘要，不存在时返回 None
+
+    Args:
+        sort (str): pstats 排序方式，如 cumulative / tottime / ncalls
+        limit (int): 最多列出的函数个数
+    """
+    if (path := profile_path(profile_id)) is None or not os.path.exists(path):
+        return None
+    stream = io.StringIO()
+    pstats.Stats(path, stream=stream).strip_dirs().sort_stats(sort).print_stats(limit)
+    return stream.getvalue()
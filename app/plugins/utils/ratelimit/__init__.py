@@ -0,0 +1 @@
+from .ratelimit import *
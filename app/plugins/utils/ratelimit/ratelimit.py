@@ -0,0 +1,335 @@
+import os
+import json
+import time
+import asyncio
+import aiosqlite
+
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+from ....manager import console
+
+
+ratelimit_folder = os.path.dirname(os.path.abspath(__file__))
+
+
+class RateLimitConfig:
+    #! sqlite 后端默认的存储位置
+    SQLITE_PATH: str = os.path.join(ratelimit_folder, "ratelimit_store.sqlite")
+    #! 每操作多少次清理一次过期数据
+    PURGE_INTERVAL: int = 256
+
+
+class RateLimit:
+    """
+    令牌桶限流规则：桶中最多有 capacity 个令牌，每 period 秒恢复一个，每次请求消耗一个
+
+    Args:
+        name (str): 规则名称，用于区分不同规则的键和统计
+        capacity (int): 桶容量，即允许的突发请求数
+        period (float): 恢复一个令牌所需的秒数
+    """
+    def __init__(self, name: str, capacity: int, period: float) -> None:
+        self.name = name
+        self.capacity = capacity
+        self.period = period
+
+    def refill(self, tokens: float, updated: float, now: float) -> float:
+        """
+        返回从 updated 到 now 恢复之后的令牌数
+        """
+        return min(float(self.capacity), tokens + (now - updated) / self.period)
+
+    def full_at(self, tokens: float, now: float) -> float:
+        """
+        返回令牌桶恢复满的时间，之后这个桶的记录可以删除
+        """
+        return now + (self.capacity - tokens) * self.period
+
+
+class RateLimitBackend(ABC):
+    """
+    限流与短期数据存储后端基类
+    """
+    @abstractmethod
+    async def take(self, items: List[Tuple[RateLimit, str]]) -> List[float]:
+        """
+        同时检查 items 中每个 key 对应的令牌桶，全部有令牌时从每个桶中各取出一个，返回全为 0 的列表；
+        否则不取出任何令牌，返回每个桶需要等待的秒数（有令牌的桶为 0）
+        """
+
+    @abstractmethod
+    async def give_back(self, items: List[Tuple[RateLimit, str]]) -> None:
+        """把取出的令牌放回 items 中的令牌桶，用于放行之后操作失败的情况"""
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        """保存可以 json 序列化的 value，ttl 秒后过期"""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Any]:
+        """读取 value，不存在或已过期时返回 None"""
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        """删除 value"""
+
+    async def purge(self) -> None:
+        """清理已经恢复满的令牌桶和过期的 value"""
+        pass
+
+    async def close(self) -> None:
+        """关闭存储，在应用关闭时调用"""
+        pass
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """
+    进程内存存储，只适用于单 worker 部署，多 worker 时每个进程各自计数
+    """
+    def __init__(self) -> None:
+        # key: (令牌数, 更新时间, 恢复满的时间)
+        self.buckets: Dict[str, Tuple[float, float, float]] = {}
+        # key: (过期时间, value)
+        self.values: Dict[str, Tuple[float, Any]] = {}
+
+    def tokens(self, limit: RateLimit, key: str, now: float) -> float:
+        if (bucket := self.buckets.get(key)) is None:
+            return float(limit.capacity)
+        return limit.refill(bucket[0], bucket[1], now)
+
+    async def take(self, items: List[Tuple[RateLimit, str]]) -> List[float]:
+        now = time.time()
+        tokens = [self.tokens(limit, key, now) for limit, key in items]
+        waits = [max(1.0 - count, 0.0) * limit.period for count, (limit, _) in zip(tokens, items)]
+        if any(waits):
+            return waits
+        for count, (limit, key) in zip(tokens, items):
+            self.buckets[key] = (count - 1.0, now, limit.full_at(count - 1.0, now))
+        return waits
+
+    async def give_back(self, items: List[Tuple[RateLimit, str]]) -> None:
+        now = time.time()
+        for limit, key in items:
+            count = min(float(limit.capacity), self.tokens(limit, key, now) + 1.0)
+            self.buckets[key] = (count, now, limit.full_at(count, now))
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        self.values[key] = (time.time() + ttl, json.loads(json.dumps(value)))
+
+    async def get(self, key: str) -> Optional[Any]:
+        if (item := self.values.get(key)) is None:
+            return None
+        expires, value = item
+        if expires < time.time():
+            self.values.pop(key, None)
+            return None
+        return json.loads(json.dumps(value))
+
+    async def delete(self, key: str) -> None:
+        self.values.pop(key, None)
+
+    async def purge(self) -> None:
+        now = time.time()
+        for key in [key for key, (_, _, full_at) in self.buckets.items() if full_at < now]:
+            self.buckets.pop(key, None)
+        for key in [key for key, (expires, _) in self.values.items() if expires < now]:
+            self.values.pop(key, None)
+
+
+class SQLiteRateLimitBackend(RateLimitBackend):
+    """
+    SQLite 存储，同一台机器上的多个 worker 共享计数
+    """
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.conn: Optional[aiosqlite.Connection] = None
+        self.lock = asyncio.Lock()
+
+    async def connect(self) -> aiosqlite.Connection:
+        if self.conn is None:
+            # isolation_level=None 时由我们自己控制事务，令牌桶的读取与写回需要在同一个写事务中完成
+            conn = await aiosqlite.connect(self.path, isolation_level=None)
+            await conn.execute("PRAGMA journal_mode=WAL")
+            await conn.execute("PRAGMA synchronous=NORMAL")
+            await conn.execute("PRAGMA busy_timeout=5000")
+            await conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, full_at REAL NOT NULL)"
+            )
+            await conn.execute(
+                "CREATE TABLE IF NOT EXISTS store ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+            self.conn = conn
+        return self.conn
+
+    async def tokens(self, conn: aiosqlite.Connection, limit: RateLimit, key: str, now: float) -> float:
+        async with conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)) as cursor:
+            row = await cursor.fetchone()
+        return float(limit.capacity) if row is None else limit.refill(row[0], row[1], now)
+
+    async def put(self, conn: aiosqlite.Connection, limit: RateLimit, key: str, tokens: float, now: float) -> None:
+        await conn.execute(
+            "INSERT OR REPLACE INTO buckets (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)",
+            (key, tokens, now, limit.full_at(tokens, now))
+        )
+
+    async def take(self, items: List[Tuple[RateLimit, str]]) -> List[float]:
+        async with self.lock:
+            conn = await self.connect()
+            # BEGIN IMMEDIATE 立即获取写锁，其他 worker 无法在读取与写回之间修改这些桶
+            await conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                tokens = [await self.tokens(conn, limit, key, now) for limit, key in items]
+                waits = [max(1.0 - count, 0.0) * limit.period for count, (limit, _) in zip(tokens, items)]
+                if not any(waits):
+                    for count, (limit, key) in zip(tokens, items):
+                        await self.put(conn, limit, key, count - 1.0, now)
+                await conn.execute("COMMIT")
+                return waits
+            except BaseException:
+                await conn.execute("ROLLBACK")
+                raise
+
+    async def give_back(self, items: List[Tuple[RateLimit, str]]) -> None:
+        async with self.lock:
+            conn = await self.connect()
+            await conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                for limit, key in items:
+                    count = min(float(limit.capacity), await self.tokens(conn, limit, key, now) + 1.0)
+                    await self.put(conn, limit, key, count, now)
+                await conn.execute("COMMIT")
+            except BaseException:
+                await conn.execute("ROLLBACK")
+                raise
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        async with self.lock:
+            conn = await self.connect()
+            await conn.execute(
+                "INSERT OR REPLACE INTO store (key, value, expires) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time() + ttl)
+            )
+
+    async def get(self, key: str) -> Optional[Any]:
+        async with self.lock:
+            conn = await self.connect()
+            async with conn.execute(
+                "SELECT value FROM store WHERE key = ? AND expires >= ?", (key, time.time())
+            ) as cursor:
+                row = await cursor.fetchone()
+        return None if row is None else json.loads(row[0])
+
+    async def delete(self, key: str) -> None:
+        async with self.lock:
+            conn = await self.connect()
+            await conn.execute("DELETE FROM store WHERE key = ?", (key,))
+
+    async def purge(self) -> None:
+        async with self.lock:
+            conn = await self.connect()
+            now = time.time()
+            await conn.execute("DELETE FROM buckets WHERE full_at < ?", (now,))
+            await conn.execute("DELETE FROM store WHERE expires < ?", (now,))
+
+    async def close(self) -> None:
+        async with self.lock:
+            if self.conn is not None:
+                await self.conn.close()
+                self.conn = None
+
+
+def create_rate_limit_backend(name: str, path: Optional[str] = None) -> RateLimitBackend:
+    """根据名称创建限流存储后端
+
+    Args:
+        name (str): memory / sqlite
+        path (Optional[str]): sqlite 数据库文件路径，为空时使用默认位置
+
+    Returns:
+        RateLimitBackend: 存储后端
+    """
+    match name:
+        case "memory":
+            return MemoryRateLimitBackend()
+        case "sqlite":
+            return SQLiteRateLimitBackend(path or RateLimitConfig.SQLITE_PATH)
+        case _:
+            raise RuntimeError(f"未知的限流后端: {name}! 可选项为 memory / sqlite")
+
+
+class RateLimiter:
+    """
+    令牌桶限流器，同时提供带有效期的短期数据存储（如验证码），并统计每条规则的放行与拒绝次数
+
+    Args:
+        backend (RateLimitBackend): 存储后端
+    """
+    def __init__(self, backend: RateLimitBackend) -> None:
+        self.backend = backend
+        # 规则名: {"allowed": 放行次数, "rejected": 拒绝次数}
+        self.counters: Dict[str, Dict[str, int]] = {}
+        self.operations: int = 0
+
+    async def hit(self, limit: RateLimit, key: str) -> float:
+        """按照 limit 对 key 计数一次
+
+        Args:
+            limit (RateLimit): 限流规则
+            key (str): 限流对象，如邮箱地址或 IP
+
+        Returns:
+            float: 放行时返回 0，被拒绝时返回需要等待的秒数
+        """
+        return await self.hit_all([(limit, key)])
+
+    async def hit_all(self, items: List[Tuple[RateLimit, str]]) -> float:
+        """同时按照多条规则计数一次，只有所有规则都放行时才消耗令牌，被拒绝的请求不会占用其他规则的额度
+
+        Args:
+            items (List[Tuple[RateLimit, str]]): (限流规则, 限流对象) 列表
+
+        Returns:
+            float: 全部放行时返回 0，否则返回需要等待的最长秒数
+        """
+        waits = await self.backend.take([(limit, f"{limit.name}:{key}") for limit, key in items])
+        rejected = any(waits)
+        for (limit, _), wait in zip(items, waits):
+            counter = self.counters.setdefault(limit.name, {"allowed": 0, "rejected": 0})
+            if wait > 0.0:
+                counter["rejected"] += 1
+            elif not rejected:
+                counter["allowed"] += 1
+        await self.maybe_purge()
+        return max(waits, default=0.0)
+
+    async def refund(self, items: List[Tuple[RateLimit, str]]) -> None:
+        """放回 hit_all 放行时消耗的令牌，用于放行之后操作失败的情况
+
+        Args:
+            items (List[Tuple[RateLimit, str]]): 与 hit_all 相同的 (限流规则, 限流对象) 列表
+        """
+        await self.backend.give_back([(limit, f"{limit.name}:{key}") for limit, key in items])
+
+    async def maybe_purge(self) -> None:
+        self.operations += 1
+        if self.operations % RateLimitConfig.PURGE_INTERVAL != 0:
+            return
+        try:
+            await self.backend.purge()
+        except Exception:
+            console.print_exception(show_locals=True)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {name: dict(counter) for name, counter in self.counters.items()}
+
+
+# 使用环境变量 RATELIMIT_BACKEND（memory / sqlite，默认为 memory）与 RATELIMIT_STORE 选择存储后端
+rate_limiter: RateLimiter = RateLimiter(create_rate_limit_backend(
+    os.getenv("RATELIMIT_BACKEND") or "memory",
+    os.getenv("RATELIMIT_STORE")
+))
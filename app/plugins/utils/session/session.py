@@ -0,0 +1,358 @@
+import os
+import json
+import time
+import asyncio
+import secrets
+import aiofiles
+import aiosqlite
+import itsdangerous
+
+from fastapi import FastAPI
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional, Tuple
+from itsdangerous.exc import BadSignature
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+from starlette.middleware.sessions import SessionMiddleware
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ....manager import console
+
+
+session_folder = os.path.dirname(os.path.abspath(__file__))
+
+
+class SessionConfig:
+    #! session 有效期（秒）
+    MAX_AGE: int = 14 * 24 * 60 * 60
+    #! cookie 名称
+    COOKIE_NAME: str = "session"
+    #! 未设置 SESSION_SECRET 时，密钥持久化保存的位置
+    SECRET_PATH: str = os.path.join(session_folder, ".session_secret")
+    #! 各后端默认的存储位置
+    SQLITE_PATH: str = os.path.join(session_folder, "session_store.sqlite")
+    FILE_FOLDER: str = os.path.join(session_folder, ".sessions/")
+    #! 每写入多少次 session 清理一次过期数据
+    PURGE_INTERVAL: int = 256
+
+
+def load_session_secret() -> str:
+    """获取签名 cookie 使用的密钥
+
+    优先使用环境变量 SESSION_SECRET，否则从 SESSION_SECRET_FILE（默认为 SessionConfig.SECRET_PATH）读取，
+    文件不存在时生成一个新的密钥并写入，使所有 worker 以及重启后的进程共享同一个密钥
+
+    Returns:
+        str: 密钥
+    """
+    if secret := os.getenv("SESSION_SECRET"):
+        return secret
+    path = os.getenv("SESSION_SECRET_FILE") or SessionConfig.SECRET_PATH
+    try:
+        # O_EXCL 保证多个 worker 同时启动时只有一个能够写入密钥
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as file:
+            file.write(secrets.token_hex(32))
+    except FileExistsError:
+        pass
+    secret = ""
+    for _ in range(50):
+        with open(path, "r", encoding="utf-8") as file:
+            secret = file.read().strip()
+        if secret:
+            break
+        # 另一个 worker 刚刚创建了文件但还没写完
+        time.sleep(0.01)
+    if not secret:
+        raise RuntimeError(f"session 密钥文件 {path} 为空！请删除该文件后重试！")
+    return secret
+
+
+class SessionBackend(ABC):
+    """
+    服务端 session 存储后端基类
+    """
+    @abstractmethod
+    async def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """读取 session，不存在或已过期时返回 None"""
+
+    @abstractmethod
+    async def save(self, session_id: str, data: Dict[str, Any], max_age: int) -> None:
+        """写入 session，max_age 秒后过期"""
+
+    @abstractmethod
+    async def delete(self, session_id: str) -> None:
+        """删除 session"""
+
+    async def purge(self) -> None:
+        """清理所有过期的 session"""
+        pass
+
+
+class MemorySessionBackend(SessionBackend):
+    """
+    进程内存 session 存储，只适用于单 worker 部署，重启后 session 丢失
+    """
+    def __init__(self) -> None:
+        self.sessions: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+
+    async def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        if (item := self.sessions.get(session_id)) is None:
+            return None
+        expires, data = item
+        if expires < time.time():
+            self.sessions.pop(session_id, None)
+            return None
+        return json.loads(json.dumps(data))
+
+    async def save(self, session_id: str, data: Dict[str, Any], max_age: int) -> None:
+        self.sessions[session_id] = (time.time() + max_age, json.loads(json.dumps(data)))
+
+    async def delete(self, session_id: str) -> None:
+        self.sessions.pop(session_id, None)
+
+    async def purge(self) -> None:
+        now = time.time()
+        for session_id in [key for key, (expires, _) in self.sessions.items() if expires < now]:
+            self.sessions.pop(session_id, None)
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """
+    SQLite session 存储，同一台机器上的多个 worker 可以共享
+    """
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.conn: Optional[aiosqlite.Connection] = None
+        self.lock = asyncio.Lock()
+
+    async def connect(self) -> aiosqlite.Connection:
+        async with self.lock:
+            if self.conn is None:
+                conn = await aiosqlite.connect(self.path)
+                await conn.execute("PRAGMA journal_mode=WAL")
+                await conn.execute("PRAGMA synchronous=NORMAL")
+                await conn.execute("PRAGMA busy_timeout=5000")
+                await conn.execute(
+                    "CREATE TABLE IF NOT EXISTS sessions ("
+                    "session_id TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL NOT NULL)"
+                )
+                await conn.commit()
+                self.conn = conn
+        return self.conn
+
+    async def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        conn = await self.connect()
+        async with conn.execute(
+            "SELECT data FROM sessions WHERE session_id = ? AND expires >= ?",
+            (session_id, time.time())
+        ) as cursor:
+            row = await cursor.fetchone()
+        return None if row is None else json.loads(row[0])
+
+    async def save(self, session_id: str, data: Dict[str, Any], max_age: int) -> None:
+        conn = await self.connect()
+        await conn.execute(
+            "INSERT OR REPLACE INTO sessions (session_id, data, expires) VALUES (?, ?, ?)",
+            (session_id, json.dumps(data), time.time() + max_age)
+        )
+        await conn.commit()
+
+    async def delete(self, session_id: str) -> None:
+        conn = await self.connect()
+        await conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        await conn.commit()
+
+    async def purge(self) -> None:
+        conn = await self.connect()
+        await conn.execute("DELETE FROM sessions WHERE expires < ?", (time.time(),))
+        await conn.commit()
+
+
+class FileSessionBackend(SessionBackend):
+    """
+    文件 session 存储，每个 session 一个 json 文件，同一台机器上的多个 worker 可以共享
+    """
+    def __init__(self, folder: str) -> None:
+        self.folder = folder
+        if not os.path.exists(folder):
+            os.makedirs(folder, exist_ok=True)
+
+    def session_path(self, session_id: str) -> str:
+        return os.path.join(self.folder, f"{session_id}.json")
+
+    async def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            async with aiofiles.open(self.session_path(session_id), "r", encoding="utf-8") as file:
+                item = json.loads(await file.read())
+        except (OSError, ValueError):
+            return None
+        if item["expires"] < time.time():
+            await self.delete(session_id)
+            return None
+        return item["data"]
+
+    async def save(self, session_id: str, data: Dict[str, Any], max_age: int) -> None:
+        path = self.session_path(session_id)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        async with aiofiles.open(temp_path, "w", encoding="utf-8") as file:
+            await file.write(json.dumps({"expires": time.time() + max_age, "data": data}))
+        # 先写临时文件再替换，其他 worker 不会读到写了一半的文件
+        os.replace(temp_path, path)
+
+    async def delete(self, session_id: str) -> None:
+        try:
+            os.remove(self.session_path(session_id))
+        except FileNotFoundError:
+            pass
+
+    async def purge(self) -> None:
+        def remove_expired() -> None:
+            now = time.time()
+            for entry in os.scandir(self.folder):
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    with open(entry.path, "r", encoding="utf-8") as file:
+                        expires = json.load(file)["expires"]
+                    if expires < now:
+                        os.remove(entry.path)
+                except (OSError, ValueError, KeyError):
+                    continue
+        await asyncio.to_thread(remove_expired)
+
+
+def create_session_backend(name: str, path: Optional[str] = None) -> SessionBackend:
+    """根据名称创建 session 存储后端
+
+    Args:
+        name (str): memory / sqlite / file
+        path (Optional[str]): sqlite 数据库文件或 session 文件夹路径，为空时使用默认位置
+
+    Returns:
+        SessionBackend: 存储后端
+    """
+    match name:
+        case "memory":
+            return MemorySessionBackend()
+        case "sqlite":
+            return SQLiteSessionBackend(path or SessionConfig.SQLITE_PATH)
+        case "file":
+            return FileSessionBackend(path or SessionConfig.FILE_FOLDER)
+        case _:
+            raise RuntimeError(f"未知的 session 后端: {name}! 可选项为 cookie / memory / sqlite / file")
+
+
+class ServerSessionMiddleware:
+    """
+    服务端 session 中间件，cookie 中只保存签名后的 session id，数据保存在 backend 中
+
+    用法与 starlette.middleware.sessions.SessionMiddleware 一致，仍然通过 request.session 读写
+    """
+    def __init__(
+        self,
+        app: ASGIApp,
+        secret_key: str,
+        backend: SessionBackend,
+        session_cookie: str = SessionConfig.COOKIE_NAME,
+        max_age: int = SessionConfig.MAX_AGE,
+        path: str = "/",
+        same_site: str = "lax",
+        https_only: bool = False
+    ) -> None:
+        self.app = app
+        self.signer = itsdangerous.TimestampSigner(secret_key)
+        self.backend = backend
+        self.session_cookie = session_cookie
+        self.max_age = max_age
+        self.path = path
+        self.security_flags = "httponly; samesite=" + same_site
+        if https_only:
+            self.security_flags += "; secure"
+        self.save_count = 0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        connection = HTTPConnection(scope)
+        session_id: Optional[str] = None
+        initial_data: Dict[str, Any] = {}
+        if self.session_cookie in connection.cookies:
+            try:
+                session_id = self.signer.unsign(
+                    connection.cookies[self.session_cookie], max_age=self.max_age
+                ).decode("utf-8")
+                initial_data = await self.backend.load(session_id) or {}
+            except BadSignature:
+                session_id = None
+        initial_dump = json.dumps(initial_data, sort_keys=True)
+        initial_session_was_empty = not initial_data
+        scope["session"] = initial_data
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal session_id
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                if scope["session"]:
+                    if json.dumps(scope["session"], sort_keys=True) != initial_dump:
+                        if session_id is None or initial_session_was_empty:
+                            # 新建的 session 总是使用新的 id，避免 session 固定攻击
+                            session_id = secrets.token_urlsafe(32)
+                        await self.backend.save(session_id, scope["session"], self.max_age)
+                        await self.maybe_purge()
+                        headers.append("Set-Cookie", self.cookie_header(
+                            self.signer.sign(session_id).decode("utf-8"),
+                            f"Max-Age={self.max_age}; "
+                        ))
+                elif not initial_session_was_empty and session_id is not None:
+                    # session 被清空，删除服务端数据并使 cookie 失效
+                    await self.backend.delete(session_id)
+                    headers.append("Set-Cookie", self.cookie_header(
+                        "null", "expires=Thu, 01 Jan 1970 00:00:00 GMT; "
+                    ))
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    def cookie_header(self, value: str, expires: str) -> str:
+        return f"{self.session_cookie}={value}; path={self.path}; {expires}{self.security_flags}"
+
+    async def maybe_purge(self) -> None:
+        self.save_count += 1
+        if self.save_count % SessionConfig.PURGE_INTERVAL != 0:
+            return
+        try:
+            await self.backend.purge()
+        except Exception:
+            console.print_exception(show_locals=True)
+
+
+def add_session_middleware(app: FastAPI) -> None:
+    """根据环境变量为 FastAPI 注册 session 中间件
+
+    环境变量：
+        SESSION_BACKEND: cookie（默认，数据签名后保存在 cookie 中）/ memory / sqlite / file
+        SESSION_STORE: sqlite 数据库文件或 session 文件夹路径
+        SESSION_SECRET / SESSION_SECRET_FILE: 见 load_session_secret
+
+    Args:
+        app (FastAPI): FastAPI 实例
+    """
+    secret_key = load_session_secret()
+    backend_name = os.getenv("SESSION_BACKEND") or "cookie"
+    if backend_name == "cookie":
+        app.add_middleware(
+            SessionMiddleware,
+            secret_key=secret_key,
+            session_cookie=SessionConfig.COOKIE_NAME,
+            max_age=SessionConfig.MAX_AGE
+        )
+    else:
+        app.add_middleware(
+            ServerSessionMiddleware,
+            secret_key=secret_key,
+            backend=create_session_backend(backend_name, os.getenv("SESSION_STORE")),
+        )
+    console.log(f"[green]使用[/green] session 后端 \"[yellow]{backend_name}[/yellow]\"")